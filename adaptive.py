@@ -0,0 +1,208 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import cli
+import results
+import shard
+
+# Multi resolution backtests for momentum and macd_example.
+#
+# Both strategies decide on daily history, so most days nothing happens and a
+# daily bar is all we need. Around a signal change though we want minute bars so
+# the fills are realistic. This steps at daily resolution by default and drops
+# to minute resolution for the day before and the day of every momentum sign
+# flip or MACD / signal crossover, plus `after` days to let the orders fill.
+#
+# The signal days come from what a daily run (memoized through
+# results.cached_run) recorded, so they are the strategy's own crossovers. The
+# segments run in parallel like shard.py, each starting with the position the
+# daily run held going into it, and are stitched together with shard.stitch.
+#
+#   python adaptive.py momentum
+#   python adaptive.py macd --before 1 --after 2
+
+# Minute segments only need the strategies' own bar counters primed, their
+# history calls are on 1d bars which catalyst loads from before the start.
+MINUTE_WARMUP_DAYS = 1
+
+
+# +1 / -1 for positive / negative 20 day momentum, as momentum.py recorded it
+def momentum_signal(daily):
+    return np.sign(daily['percent_change'])
+
+
+# +1 / -1 for MACD above / below its signal line, as macd_example recorded it
+# (talib over its 40 bar window, NaN until that's seeded)
+def macd_signal(daily):
+    return np.sign(daily['macd'] - daily['macd_signal'])
+
+
+SIGNALS = {
+    'momentum': momentum_signal,
+    'macd': macd_signal,
+}
+
+# The flag each strategy keeps for "in the market", set when a segment starts
+# holding the daily run's position
+HOLDING_FLAGS = {
+    'momentum': 'holding',
+    'macd': 'bought',
+}
+
+
+def signal_days(signal):
+    values = signal.values
+    valid = ~np.isnan(values)
+    changed = np.r_[False, (values[1:] != values[:-1]) & valid[1:] & valid[:-1]]
+    return signal.index[changed]
+
+
+# Split [start, end] into (start, end, frequency) segments: minute resolution
+# from `before` days before each signal day to `after` days after it, daily
+# everywhere else. Overlapping minute windows are merged.
+def schedule(start, end, days, before=1, after=1):
+    start = pd.to_datetime(start, utc=True).normalize()
+    end = pd.to_datetime(end, utc=True).normalize()
+    one_day = pd.Timedelta(days=1)
+
+    windows = []
+    for day in sorted(pd.DatetimeIndex(days).normalize()):
+        lo = max(start, day - before * one_day)
+        hi = min(end, day + after * one_day)
+        if lo > hi:
+            continue
+        if windows and lo <= windows[-1][1] + one_day:
+            windows[-1][1] = max(windows[-1][1], hi)
+        else:
+            windows.append([lo, hi])
+
+    segments = []
+    cursor = start
+    for lo, hi in windows:
+        if cursor < lo:
+            segments.append((cursor, lo - one_day, 'daily'))
+        segments.append((lo, hi, 'minute'))
+        cursor = hi + one_day
+    if cursor <= end:
+        segments.append((cursor, end, 'daily'))
+    return segments
+
+
+def _segment_shards(segments, warmup_days):
+    shards = []
+    for k, (start, end, frequency) in enumerate(segments):
+        warmup = warmup_days if frequency == 'daily' else MINUTE_WARMUP_DAYS
+        run_start = start if k == 0 else start - pd.Timedelta(days=warmup)
+        shards.append(shard.Shard(run_start, start, end))
+    return shards
+
+
+# Fraction of the portfolio the daily run held going into day `start`.
+def starting_exposure(daily, start):
+    held = shard._exposure(daily)[daily.index < start]
+    if not len(held) or np.isnan(held.iloc[-1]) or abs(held.iloc[-1]) < 1e-6:
+        return 0.0
+    return float(held.iloc[-1])
+
+
+# shard.run_shard, but starting with `exposure` of the portfolio in the asset
+# and the strategy's holding flag set to match. Without this a segment around
+# an exit crossover starts flat and never places the exit.
+def run_segment(name, segment, overrides, exposure=0.0):
+    if not exposure:
+        return shard.run_shard(name, segment, overrides)
+
+    from catalyst.api import order_target_percent
+
+    strategy = cli.load_strategy(name)
+    flag = HOLDING_FLAGS[name]
+
+    def initialize(context):
+        strategy.initialize(context)
+        setattr(context, flag, True)
+        context.seed_exposure = exposure
+
+    def handle_data(context, data):
+        strategy.handle_data(context, data)
+        # buy in on the first bar, unless the strategy just exited anyway
+        if context.seed_exposure is not None:
+            if getattr(context, flag):
+                order_target_percent(context.asset, context.seed_exposure)
+            context.seed_exposure = None
+
+    return cli.run(name, plot=False, initialize=initialize, handle_data=handle_data,
+            start=segment.run_start, end=segment.end, **overrides)
+
+
+# daily is a daily perf of the same strategy to take signal days and starting
+# positions from, by default a (cached) daily run over the same range.
+def run_adaptive(name, before=1, after=1, daily=None, max_workers=None, **overrides):
+    if name not in SIGNALS:
+        raise KeyError("No signal for '{}', adaptive mode supports: {}".format(
+            name, ', '.join(sorted(SIGNALS))))
+
+    config = cli.strategy_config(name, **overrides)
+    if daily is None:
+        daily = results.cached_run(name, **dict(config, data_frequency='daily'))
+    daily = daily.copy()
+    daily.index = pd.to_datetime(daily.index, utc=True)
+
+    days = signal_days(SIGNALS[name](daily))
+    segments = schedule(config['start'], config['end'], days, before, after)
+    shards = _segment_shards(segments, shard.WARMUP_DAYS.get(name, 0))
+
+    base = dict((k, v) for k, v in config.items()
+            if k not in ('start', 'end', 'data_frequency'))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_segment, name, s, dict(base, data_frequency=segment[2]),
+                    starting_exposure(daily, s.run_start))
+                for s, segment in zip(shards, segments)]
+        perfs = [f.result() for f in futures]
+
+    for perf in perfs:
+        perf.index = pd.to_datetime(perf.index, utc=True)
+
+    perf = shard.stitch(perfs, shards, config['capital_base'], [segment[2] for segment in segments])
+    perf['resolution'] = np.concatenate([
+        np.repeat(segment[2], int((p.index >= s.start).sum()))
+        for p, s, segment in zip(perfs, shards, segments)])
+
+    return shard.ShardedResult(perf, shard.divergence(perfs, shards), shards), segments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Daily backtest that switches to minute bars around signal changes')
+    parser.add_argument('strategy', choices=sorted(SIGNALS))
+    parser.add_argument('--before', type=int, default=1, help='minute days before a signal change')
+    parser.add_argument('--after', type=int, default=1, help='minute days after a signal change')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--exchange', dest='exchange_name')
+    parser.add_argument('--capital', dest='capital_base', type=float)
+    args = parser.parse_args(argv)
+
+    result, segments = run_adaptive(args.strategy,
+            before=args.before,
+            after=args.after,
+            max_workers=args.workers,
+            start=args.start,
+            end=args.end,
+            exchange_name=args.exchange_name,
+            capital_base=args.capital_base,
+            )
+
+    minute_days = sum((end - start).days + 1 for start, end, frequency in segments if frequency == 'minute')
+    total_days = (segments[-1][1] - segments[0][0]).days + 1
+    print("{} segments, {} of {} days at minute resolution".format(len(segments), minute_days, total_days))
+    cli.print_summary(result.perf)
+    if result.divergence['diverged'].any():
+        print("WARNING: some segments did not line up with the previous one:")
+        print(result.divergence[result.divergence['diverged']].to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
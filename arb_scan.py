@@ -0,0 +1,168 @@
+import argparse
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import compact
+from arbitrage import get_adjusted_prices, get_fee
+
+# Offline scan for the opportunities arbitrage.py trades on.
+#
+# Lines the poloniex and binance eth_btc minute series up on one time grid and
+# applies arbitrage.get_adjusted_prices and the fee check from
+# is_profitable_after_fees to whole arrays at once. Every run of consecutive
+# profitable minutes comes back as a window with its duration, spread and
+# expected profit, for every slippage / fee assumption in the sweep.
+#
+#   python arb_scan.py poloniex_eth_btc.csv binance_eth_btc.csv
+#
+# Each csv needs a datetime index and a `price` column. A perf from an earlier
+# arbitrage run works too, see prices_from_perf.
+
+# Taker fees at the time, as fractions of the price
+TAKER_FEES = {
+    'poloniex': 0.0025,
+    'binance': 0.001,
+}
+
+
+class _Api(object):
+    def __init__(self, taker):
+        self.fees = {'trading': {'taker': taker}}
+
+
+# Just enough of a catalyst exchange for get_fee
+class Market(object):
+    def __init__(self, name, taker):
+        self.name = name
+        self.api = _Api(taker)
+
+
+Scenario = namedtuple('Scenario', ['slippage', 'poloniex_fee', 'binance_fee'])
+
+
+# One grid for both venues. A venue's last price is carried forward for up to
+# `max_stale` minutes, minutes where either side is older than that are dropped.
+# mode='float32' keeps the grid (and everything computed off it) in float32.
+def align(poloniex_price, binance_price, freq='1min', max_stale=5, mode=compact.FLOAT64):
+    frame = pd.concat([poloniex_price, binance_price], axis=1, keys=['poloniex', 'binance'])
+    frame = frame.resample(freq).last().ffill(limit=max_stale)
+    return frame.dropna().astype(compact.compute_dtype(mode))
+
+
+def prices_from_perf(perf):
+    return perf['poloniex_price'], perf['binance_price']
+
+
+# Every combination of slippage and fee levels to test.
+def scenarios(slippages=(0.03,), poloniex_fees=None, binance_fees=None):
+    poloniex_fees = poloniex_fees or [TAKER_FEES['poloniex']]
+    binance_fees = binance_fees or [TAKER_FEES['binance']]
+    return [Scenario(s, pf, bf)
+            for s in slippages for pf in poloniex_fees for bf in binance_fees]
+
+
+# Expected profit per unit on every bar for selling on `sell` and buying on
+# `buy`, same maths as is_profitable_after_fees.
+def expected_profit(sell_raw, buy_raw, slippage, sell_market, buy_market):
+    sell_price, _ = get_adjusted_prices(sell_raw, slippage)
+    _, buy_price = get_adjusted_prices(buy_raw, slippage)
+    return sell_price - buy_price - get_fee(sell_market, sell_price) - get_fee(buy_market, buy_price)
+
+
+# Start / end (exclusive) positions of each run of True in mask.
+def _runs(mask):
+    edges = np.diff(np.r_[0, mask.astype(np.int8), 0])
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def scan(poloniex_price, binance_price, scenario_list=None, freq='1min', **align_kwargs):
+    grid = align(poloniex_price, binance_price, freq=freq, **align_kwargs)
+    # a window's last bar lasts until the bar after it
+    bar = pd.Timedelta(pd.tseries.frequencies.to_offset(freq))
+    poloniex = grid['poloniex'].values
+    binance = grid['binance'].values
+    spread = poloniex - binance
+    index = grid.index
+
+    windows = []
+    for scenario in scenario_list or scenarios():
+        markets = {
+            'poloniex': Market('poloniex', scenario.poloniex_fee),
+            'binance': Market('binance', scenario.binance_fee),
+        }
+        directions = [
+            ('sell_poloniex_buy_binance', poloniex, binance, markets['poloniex'], markets['binance']),
+            ('sell_binance_buy_poloniex', binance, poloniex, markets['binance'], markets['poloniex']),
+        ]
+
+        for direction, sell_raw, buy_raw, sell_market, buy_market in directions:
+            profit = expected_profit(sell_raw, buy_raw, scenario.slippage, sell_market, buy_market)
+            starts, ends = _runs(profit > 0)
+            if len(starts) == 0:
+                continue
+
+            # Per window sums via cumsum so we don't loop over windows
+            # (in float64 whatever the grid is, float32 running sums drift)
+            csum_profit = np.r_[0.0, np.cumsum(np.where(profit > 0, profit, 0.0), dtype=np.float64)]
+            csum_spread = np.r_[0.0, np.cumsum(np.abs(spread), dtype=np.float64)]
+            bars = ends - starts
+
+            windows.append(pd.DataFrame({
+                'slippage': scenario.slippage,
+                'poloniex_fee': scenario.poloniex_fee,
+                'binance_fee': scenario.binance_fee,
+                'direction': direction,
+                'start': index[starts],
+                'end': index[ends - 1],
+                'bars': bars,
+                'duration': index[ends - 1] - index[starts] + bar,
+                'mean_spread': (csum_spread[ends] - csum_spread[starts]) / bars,
+                'max_profit': np.maximum.reduceat(profit, starts),
+                'total_profit': csum_profit[ends] - csum_profit[starts],
+            }))
+
+    columns = ['slippage', 'poloniex_fee', 'binance_fee', 'direction', 'start', 'end',
+            'bars', 'duration', 'mean_spread', 'max_profit', 'total_profit']
+    if not windows:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(windows, ignore_index=True)[columns]
+
+
+# Windows rolled up per scenario: which assumptions leave anything to trade.
+def summarize(windows):
+    keys = ['slippage', 'poloniex_fee', 'binance_fee']
+    if windows.empty:
+        return pd.DataFrame(columns=keys + ['windows', 'bars', 'total_profit'])
+    grouped = windows.groupby(keys)
+    return pd.DataFrame({
+        'windows': grouped.size(),
+        'bars': grouped['bars'].sum(),
+        'total_profit': grouped['total_profit'].sum(),
+    }, columns=['windows', 'bars', 'total_profit']).reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Vectorized scan for poloniex / binance arbitrage windows')
+    parser.add_argument('poloniex_csv')
+    parser.add_argument('binance_csv')
+    parser.add_argument('--slippage', type=float, nargs='+', default=[0.0, 0.001, 0.005, 0.01, 0.03])
+    parser.add_argument('--poloniex-fee', type=float, nargs='+')
+    parser.add_argument('--binance-fee', type=float, nargs='+')
+    parser.add_argument('--out', help='write every window to this csv')
+    args = parser.parse_args(argv)
+
+    poloniex = pd.read_csv(args.poloniex_csv, index_col=0, parse_dates=True)['price']
+    binance = pd.read_csv(args.binance_csv, index_col=0, parse_dates=True)['price']
+
+    windows = scan(poloniex, binance,
+            scenarios(args.slippage, args.poloniex_fee, args.binance_fee))
+
+    print(summarize(windows).to_string(index=False))
+    if args.out:
+        windows.to_csv(args.out, index=False)
+
+
+if __name__ == '__main__':
+    main()
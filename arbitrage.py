@@ -3,12 +3,13 @@ from catalyst.utils.run_algo import run_algorithm
 from catalyst.api import symbol, record, order, get_datetime, commission, slippage
 from catalyst.exchange.utils.stats_utils import extract_transactions
 #  from catalyst #import run_algorithm
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
 from catalyst.exchange.utils.stats_utils import get_pretty_stats
 
+from order_batch import CatalystVenue, Leg, OrderBatch
+
 def initialize(context):
     context.asset = symbol('btc_usdt')
     context.binance     = context.exchanges['binance']
@@ -18,7 +19,20 @@ def initialize(context):
     context.poloniex_trading_pair   = symbol('eth_btc', context.poloniex.name)
     #  context.set_commission(maker=0.2, taker=0.2)
 
+    # Live, both legs go out at once (see order_batch.py). The backtest fills
+    # orders synchronously anyway so it keeps using order().
+    context.order_batch = None
+    if getattr(context, 'mode_name', None) == 'live':
+        context.order_batch = OrderBatch({
+            context.binance.name: CatalystVenue(context, context.binance),
+            context.poloniex.name: CatalystVenue(context, context.poloniex),
+        })
+
 def handle_data(context, data):
+    if context.order_batch is not None:
+        # unwinds of legs that acked late since the last bar
+        context.order_batch.reconcile()
+
     poloniex_price   = data.current(context.poloniex_trading_pair, 'price')
     binance_price    = data.current(context.binance_trading_pair, 'price')
     slippage = 0.03
@@ -32,22 +46,16 @@ def handle_data(context, data):
 
     if is_profitable_after_fees(sell_p, buy_b, context.poloniex, context.binance):
         # Buy on binance, sell on poloniex
-        order(asset=context.binance_trading_pair,
-                amount=1,
-                limit_price=binance_price)
-
-        order(asset=context.poloniex_trading_pair,
-                amount=-1,
-                limit_price=poloniex_price)
+        place_legs(context, [
+            Leg(context.binance.name, context.binance_trading_pair, 1, binance_price),
+            Leg(context.poloniex.name, context.poloniex_trading_pair, -1, poloniex_price),
+        ])
     elif is_profitable_after_fees(sell_b, buy_p, context.binance, context.poloniex):
         # buy poloniex, sell binance
-        order(asset=context.binance_trading_pair,
-                amount=-1,
-                limit_price=binance_price)
-
-        order(asset=context.poloniex_trading_pair,
-                amount=1,
-                limit_price=poloniex_price)
+        place_legs(context, [
+            Leg(context.binance.name, context.binance_trading_pair, -1, binance_price),
+            Leg(context.poloniex.name, context.poloniex_trading_pair, 1, poloniex_price),
+        ])
 
     record(
         poloniex_price=poloniex_price,
@@ -55,6 +63,22 @@ def handle_data(context, data):
         cash=context.portfolio.cash,
     )
 
+def place_legs(context, legs):
+    if context.order_batch is None:
+        for leg in legs:
+            order(asset=leg.asset, amount=leg.amount, limit_price=leg.limit_price)
+        return
+
+    result = context.order_batch.submit(legs)
+    context.order_batch.reconcile()
+    if not result.ok:
+        for r in result.legs:
+            if r.error is not None:
+                print("{} leg failed: {}".format(r.leg.venue, r.error))
+        print("Reversed {} filled leg(s)".format(len(result.unwinds)))
+    elif result.matched < 1:
+        print("Legs filled {:.0%}, reversed {} excess fill(s)".format(result.matched, len(result.unwinds)))
+
 def is_profitable_after_fees(sell_price, buy_price, sell_market, buy_market):
     sell_fee = get_fee(sell_market, sell_price)
     buy_fee = get_fee(buy_market, buy_price)
@@ -76,6 +100,8 @@ def get_adjusted_prices(price, slippage):
     return adj_sell_price, adj_buy_price
 
 def analyze(context, perf):
+    import matplotlib.pyplot as plt
+
     exchange = list(context.exchanges.values())[0]
     quote_currency = exchange.quote_currency.upper()
 
@@ -216,15 +242,15 @@ def analyze(context, perf):
 
 
 
-#  if __name__ == '__main__':
-run_algorithm(capital_base=1000,
-        data_frequency='minute',
-        initialize=initialize,
-        handle_data=handle_data,
-        analyze=analyze,
-        exchange_name='poloniex, binance',
-        quote_currency='usdt',
-        live=False,
-        start=pd.to_datetime('2017-1-1', utc=True),
-        end=pd.to_datetime('2018-1-1', utc=True),
-        )
+if __name__ == '__main__':
+    run_algorithm(capital_base=1000,
+            data_frequency='minute',
+            initialize=initialize,
+            handle_data=handle_data,
+            analyze=analyze,
+            exchange_name='poloniex, binance',
+            quote_currency='usdt',
+            live=False,
+            start=pd.to_datetime('2017-1-1', utc=True),
+            end=pd.to_datetime('2018-1-1', utc=True),
+            )
@@ -0,0 +1,165 @@
+import argparse
+import importlib
+
+# One entry point for all the strategies in this repo.
+#
+#   python cli.py --list
+#   python cli.py rsi
+#   python cli.py macd --start 2017-6-1 --end 2017-9-1 --capital 5000 --no-plot
+#   python cli.py arbitrage --exchange "poloniex, binance" --frequency minute
+#
+# Nothing heavy (catalyst, pandas, talib, matplotlib) is imported until we know
+# which strategy to run, and matplotlib is never imported with --no-plot since
+# the strategies only import it inside analyze.
+
+# name -> (module, default run_algorithm arguments). The defaults are the ones
+# each script uses in its own __main__ block.
+STRATEGIES = {
+    'hodl': ('hodl_example', dict(
+        capital_base=1000,
+        data_frequency='daily',
+        exchange_name='poloniex',
+        quote_currency='usdt',
+        start='2017-1-1',
+        end='2018-1-1',
+    )),
+    'momentum': ('momentum', dict(
+        capital_base=1000,
+        data_frequency='daily',
+        exchange_name='poloniex',
+        quote_currency='usdt',
+        start='2017-1-1',
+        end='2018-1-1',
+    )),
+    'macd': ('macd_example', dict(
+        capital_base=1000,
+        data_frequency='daily',
+        exchange_name='poloniex',
+        quote_currency='usdt',
+        start='2017-1-1',
+        end='2018-1-1',
+    )),
+    'rsi': ('rsi_example', dict(
+        capital_base=1000,
+        data_frequency='daily',
+        exchange_name='poloniex',
+        quote_currency='usdt',
+        algo_namespace='rsi_example',
+        start='2017-1-1',
+        end='2018-1-1',
+    )),
+    'arbitrage': ('arbitrage', dict(
+        capital_base=1000,
+        data_frequency='minute',
+        exchange_name='poloniex, binance',
+        quote_currency='usdt',
+        start='2017-1-1',
+        end='2018-1-1',
+    )),
+    'graphing': ('graphing_example', dict(
+        capital_base=10000,
+        data_frequency='minute',
+        exchange_name='poloniex',
+        quote_currency='usdt',
+        start='2017-10-28',
+        end='2017-10-30',
+    )),
+}
+
+
+def load_strategy(name):
+    if name not in STRATEGIES:
+        raise KeyError("Unknown strategy '{}', expected one of: {}".format(
+            name, ', '.join(sorted(STRATEGIES))))
+    module_name, _ = STRATEGIES[name]
+    return importlib.import_module(module_name)
+
+
+# run_algorithm arguments for a strategy: its defaults with any overrides on
+# top. Dates are left as strings here so building a config stays cheap.
+def strategy_config(name, **overrides):
+    _, defaults = STRATEGIES[name]
+    config = dict(defaults)
+    config.update((k, v) for k, v in overrides.items() if v is not None)
+    return config
+
+
+# Run a strategy by name and return the perf frame. handle_data can be swapped
+# for a wrapped version of the strategy's own (see risk.guard).
+def run(name, plot=True, initialize=None, handle_data=None, **overrides):
+    import pandas as pd
+    from catalyst import run_algorithm
+
+    strategy = load_strategy(name)
+    config = strategy_config(name, **overrides)
+    config['start'] = pd.to_datetime(config['start'], utc=True)
+    config['end'] = pd.to_datetime(config['end'], utc=True)
+
+    return run_algorithm(
+            initialize=initialize or strategy.initialize,
+            handle_data=handle_data or strategy.handle_data,
+            analyze=strategy.analyze if plot else None,
+            live=False,
+            **config
+            )
+
+
+def print_summary(perf):
+    print("Starting Cash: $", perf.starting_cash.iloc[0])
+    print("Ending portfolio value: $", perf.portfolio_value.iloc[-1])
+    print("Cash: $", perf.cash.iloc[-1])
+    print("Max Drawdown: ", perf.max_drawdown.min() * 100, "%")
+    print("Algorithm Period Return: ", perf.algorithm_period_return.iloc[-1] * 100, "%")
+    print("Pnl $", perf.pnl.sum())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run one of the catalyst strategies in this repo')
+    parser.add_argument('strategy', nargs='?', choices=sorted(STRATEGIES))
+    parser.add_argument('--list', action='store_true', help='list the strategies and their defaults')
+    parser.add_argument('--start', help='e.g. 2017-1-1')
+    parser.add_argument('--end', help='e.g. 2018-1-1')
+    parser.add_argument('--exchange', dest='exchange_name', help="e.g. poloniex or 'poloniex, binance'")
+    parser.add_argument('--quote-currency', dest='quote_currency')
+    parser.add_argument('--capital', dest='capital_base', type=float)
+    parser.add_argument('--frequency', dest='data_frequency', choices=['daily', 'minute'])
+    parser.add_argument('--no-plot', dest='plot', action='store_false',
+            help='skip analyze (and matplotlib), just print a summary')
+    parser.add_argument('--export', metavar='PATH',
+            help='also write perf to PATH as columnar tables, see perf_export.py')
+    args = parser.parse_args(argv)
+    if not args.list and args.strategy is None:
+        parser.error('a strategy is required unless --list is given')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.list:
+        for name in sorted(STRATEGIES):
+            module_name, defaults = STRATEGIES[name]
+            print("{:<10} {:<18} {data_frequency} {exchange_name} {start} -> {end} capital {capital_base}".format(
+                name, module_name, **defaults))
+        return
+
+    perf = run(args.strategy,
+            plot=args.plot,
+            start=args.start,
+            end=args.end,
+            exchange_name=args.exchange_name,
+            quote_currency=args.quote_currency,
+            capital_base=args.capital_base,
+            data_frequency=args.data_frequency,
+            )
+
+    if args.export:
+        import perf_export
+        perf_export.export(perf, args.export)
+
+    if not args.plot:
+        print_summary(perf)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import math
+from collections import deque, namedtuple
+
+from arbitrage import get_adjusted_prices, get_fee
+
+# Triangular / multi-hop arbitrage detection.
+#
+# arbitrage.py only looks at eth_btc on two venues. With btc_usdt, eth_btc and
+# eth_usdt on both poloniex and binance there are cycles across pairs and venues
+# (usdt -> btc -> eth -> usdt, or btc on binance -> eth -> btc on poloniex...)
+# it can't see. Every (venue, currency) is a node, every way of converting one
+# into another is an edge weighted -log(rate after fees), so a profitable cycle
+# is a negative cycle.
+#
+# Only the edges whose quotes changed are updated each bar, and the SPFA
+# (queue based Bellman-Ford) restarts from the previous distances, only
+# re-examining nodes downstream of those edges.
+#
+#   graph = RateGraph({'poloniex': context.poloniex, 'binance': context.binance})
+#   graph.set_price('poloniex', 'eth_btc', price, slippage=0.001)
+#   ...
+#   cycle = graph.find_cycle()
+#   if cycle is not None and cycle.profit > 0.001:
+#       ...
+
+Cycle = namedtuple('Cycle', ['nodes', 'profit'])
+
+# Log rates don't sum back to exactly 0 around a consistent cycle (usdt -> btc
+# -> eth -> usdt at 5000, 0.05, 250 comes to ~1e-15), so anything closer to 0
+# than this is rounding, not profit.
+TOLERANCE = 1e-12
+
+
+class RateGraph(object):
+    # markets is venue -> catalyst exchange (anything get_fee accepts).
+    # transfer_cost, if set, adds edges moving a currency between venues at
+    # that fractional cost; None keeps each venue's balances separate.
+    def __init__(self, markets, transfer_cost=None):
+        self.fee_rates = dict((venue, get_fee(market, 1.0)) for venue, market in markets.items())
+        self.transfer_cost = transfer_cost
+
+        self.nodes = []
+        self.node_ids = {}
+        self.out_edges = []     # node -> {node: weight}
+        self.dist = []
+        self.pred = []
+
+        self._changed = []
+        self._reset = True
+
+    def _node(self, venue, currency):
+        key = (venue, currency)
+        if key not in self.node_ids:
+            self.node_ids[key] = len(self.nodes)
+            self.nodes.append(key)
+            self.out_edges.append({})
+            self.dist.append(0.0)
+            self.pred.append(-1)
+
+            if self.transfer_cost is not None:
+                weight = -math.log(1 - self.transfer_cost)
+                for other, node in list(self.node_ids.items()):
+                    if other[1] == currency and other[0] != venue:
+                        self._set_edge(node, self.node_ids[key], weight)
+                        self._set_edge(self.node_ids[key], node, weight)
+        return self.node_ids[key]
+
+    def _set_edge(self, u, v, weight):
+        old = self.out_edges[u].get(v)
+        if old == weight:
+            return
+        self.out_edges[u][v] = weight
+        # A dearer edge on the shortest path tree invalidates the distances,
+        # a cheaper one can just be relaxed from where we are
+        if old is not None and weight > old and self.pred[v] == u:
+            self._reset = True
+        self._changed.append(u)
+
+    # Best bid / ask for a pair like 'eth_btc' on a venue. Selling 1 eth gets
+    # bid btc, buying 1 eth costs ask btc, both less the venue's taker fee.
+    def set_quote(self, venue, pair, bid, ask):
+        base, quote = pair.split('_')
+        b = self._node(venue, base)
+        q = self._node(venue, quote)
+        keep = 1 - self.fee_rates[venue]
+        self._set_edge(b, q, -math.log(bid * keep))
+        self._set_edge(q, b, -math.log(keep / ask))
+
+    # Minute bar price with a slippage band, the same way arbitrage.py prices
+    # its orders.
+    def set_price(self, venue, pair, price, slippage=0.0):
+        sell, buy = get_adjusted_prices(price, slippage)
+        self.set_quote(venue, pair, sell, buy)
+
+    # Walk pred pointers back from a node on or downstream of a negative cycle
+    # until a node repeats, and read the cycle off. None if the walk runs off
+    # the tree, which can happen with pointers left over from a warm start.
+    def _extract(self, v):
+        seen = {}
+        walk = []
+        while v != -1 and v not in seen:
+            seen[v] = len(walk)
+            walk.append(v)
+            v = self.pred[v]
+        if v == -1:
+            return None
+
+        cycle = walk[seen[v]:] + [v]
+        cycle.reverse()
+        weight = sum(self.out_edges[a][b] for a, b in zip(cycle[:-1], cycle[1:]))
+        if weight >= -TOLERANCE:
+            return None
+        return Cycle([self.nodes[n] for n in cycle], math.exp(-weight) - 1)
+
+    # A profitable cycle if there is one, else None. Distances from a virtual
+    # source joined to every node at 0, so every cycle is reachable.
+    def find_cycle(self):
+        n = len(self.nodes)
+        cold = self._reset
+        if cold:
+            self.dist = [0.0] * n
+            self.pred = [-1] * n
+            queue = deque(range(n))
+            self._reset = False
+        else:
+            queue = deque(set(self._changed))
+        self._changed = []
+
+        in_queue = [False] * n
+        for u in queue:
+            in_queue[u] = True
+        hops = [0] * n
+
+        dist = self.dist
+        pred = self.pred
+        while queue:
+            u = queue.popleft()
+            in_queue[u] = False
+            du = dist[u]
+            for v, w in self.out_edges[u].items():
+                if du + w < dist[v] - TOLERANCE:
+                    dist[v] = du + w
+                    pred[v] = u
+                    hops[v] = hops[u] + 1
+                    if hops[v] >= n:
+                        # Distances are meaningless with a negative cycle in
+                        # the graph, start over next time
+                        cycle = self._extract(v)
+                        self._reset = True
+                        if cycle is None and not cold:
+                            return self.find_cycle()
+                        return cycle
+                    if not in_queue[v]:
+                        in_queue[v] = True
+                        queue.append(v)
+        return None
@@ -0,0 +1,331 @@
+import argparse
+import mmap
+import os
+import time
+
+import numpy as np
+
+import tick_replay
+
+# One market data feed shared by any number of strategy processes.
+#
+# Instead of rsi_example, macd_example, momentum and arbitrage each polling
+# btc_usdt / eth_btc on their own, one feed process writes normalized bars and
+# quotes into a ring buffer in shared memory (an mmap'd file, /dev/shm on
+# linux) and every strategy reads from it. Nothing is locked: each slot carries
+# the sequence number of the record in it, the writer invalidates the slot,
+# writes the record and then publishes the sequence number, and a reader only
+# trusts a record if the slot's sequence is the one it expected both before and
+# after copying it. A reader that falls more than a ring behind skips ahead and
+# counts what it missed. A restarted feed process writes a fresh file and
+# renames it over the old one; readers finish the old file and carry on from
+# the start of the new one (counting it in resyncs).
+#
+#   python feed.py live --exchange poloniex --symbols btc_usdt eth_btc
+#   python feed.py replay --stream poloniex:book:data/poloniex_eth_btc_book.bin \
+#                         --stream binance:book:data/binance_eth_btc_book.bin
+#
+#   # in a strategy
+#   reader = feed.FeedReader()
+#   for record in reader.read():
+#       ...
+
+DEFAULT_PATH = '/dev/shm/catalyst_feed' if os.path.isdir('/dev/shm') else '/tmp/catalyst_feed'
+
+MAGIC = 0x43415446454544   # "CATFEED"
+
+BAR = 1
+QUOTE = 2
+
+RECORD_DTYPE = np.dtype([
+    ('ts', '<i8'),          # nanoseconds since the epoch
+    ('kind', 'i1'),         # BAR or QUOTE
+    ('venue', 'S16'),
+    ('symbol', 'S16'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+])
+
+SLOT_DTYPE = np.dtype([
+    ('seq', '<i8'),
+    ('record', RECORD_DTYPE),
+])
+
+# magic, capacity, slot size, next sequence to be written
+HEADER_FIELDS = 4
+HEADER_BYTES = HEADER_FIELDS * 8
+
+
+# Map an existing feed file. Returns the mmap, header, slots and the file's
+# inode, which is how readers notice the writer has replaced the file.
+def _map(path):
+    with open(path, 'r+b') as f:
+        mm = mmap.mmap(f.fileno(), 0)
+        inode = os.fstat(f.fileno()).st_ino
+    header = np.ndarray((HEADER_FIELDS,), dtype='<i8', buffer=mm)
+    if header[0] != MAGIC or header[2] != SLOT_DTYPE.itemsize:
+        mm.close()
+        raise ValueError("{} is not a feed written by this version of feed.py".format(path))
+    slots = np.ndarray((int(header[1]),), dtype=SLOT_DTYPE, buffer=mm, offset=HEADER_BYTES)
+    return mm, header, slots, inode
+
+
+class FeedWriter(object):
+    # A new writer never touches the existing file, readers may still have it
+    # mapped. It builds a fresh one next to it and renames it into place, and
+    # readers switch over on their next read.
+    def __init__(self, path=DEFAULT_PATH, capacity=1 << 16):
+        self.path = path
+        self.capacity = capacity
+
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.truncate(HEADER_BYTES + capacity * SLOT_DTYPE.itemsize)
+        with open(tmp, 'r+b') as f:
+            self.mm = mmap.mmap(f.fileno(), 0)
+        self.header = np.ndarray((HEADER_FIELDS,), dtype='<i8', buffer=self.mm)
+        self.slots = np.ndarray((capacity,), dtype=SLOT_DTYPE, buffer=self.mm, offset=HEADER_BYTES)
+
+        self.slots['seq'] = -1
+        self.header[3] = 0
+        self.header[1] = capacity
+        self.header[2] = SLOT_DTYPE.itemsize
+        self.header[0] = MAGIC
+        os.rename(tmp, path)
+
+    # Publish a batch. Each slot is invalidated, written and then stamped with
+    # its sequence number, and the header only moves once the whole batch is in.
+    def publish(self, records):
+        records = np.atleast_1d(np.asarray(records, dtype=RECORD_DTYPE))
+        seq = int(self.header[3])
+        if len(records) > self.capacity:
+            # only the newest capacity records would survive anyway
+            seq += len(records) - self.capacity
+            records = records[-self.capacity:]
+
+        seqs = np.arange(seq, seq + len(records))
+        idx = seqs % self.capacity
+        self.slots['seq'][idx] = -1
+        self.slots['record'][idx] = records
+        self.slots['seq'][idx] = seqs
+        self.header[3] = seq + len(records)
+        return seq + len(records)
+
+    def close(self):
+        self.mm.close()
+
+
+class FeedReader(object):
+    # start='latest' only sees records published from now on, 'oldest' starts
+    # at the oldest record still in the ring.
+    def __init__(self, path=DEFAULT_PATH, start='latest'):
+        self.path = path
+        self.mm, self.header, self.slots, self.inode = _map(path)
+        self.capacity = len(self.slots)
+        head = int(self.header[3])
+        self.next = head if start == 'latest' else max(0, head - self.capacity)
+        self.dropped = 0
+        # times the feed restarted under us
+        self.resyncs = 0
+
+    # Start over from the oldest record of whatever feed is at path now.
+    def _resync(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            inode = self.inode
+        if inode != self.inode:
+            self.mm.close()
+            self.mm, self.header, self.slots, self.inode = _map(self.path)
+            self.capacity = len(self.slots)
+        self.next = max(0, int(self.header[3]) - self.capacity)
+        self.resyncs += 1
+
+    # Everything published since the last call, up to max_records.
+    def read(self, max_records=None):
+        try:
+            replaced = os.stat(self.path).st_ino != self.inode
+        except OSError:
+            replaced = False
+
+        if replaced:
+            # a new writer. Finish what the old one published (its file stays
+            # readable while we have it mapped), then move over to the new one.
+            tail = self._read_mapped(max_records)
+            self._resync()
+            if len(tail):
+                return tail
+        elif int(self.header[3]) < self.next:
+            # the sequence went backwards under us, start again from the ring
+            self._resync()
+
+        return self._read_mapped(max_records)
+
+    def _read_mapped(self, max_records):
+        head = int(self.header[3])
+        if head - self.next > self.capacity:
+            # lapped by the writer, the oldest ones are gone
+            skip_to = head - self.capacity
+            self.dropped += skip_to - self.next
+            self.next = skip_to
+
+        stop = head if max_records is None else min(head, self.next + max_records)
+        seqs = np.arange(self.next, stop)
+        idx = seqs % self.capacity
+
+        before = self.slots['seq'][idx]
+        records = self.slots['record'][idx]
+        after = self.slots['seq'][idx]
+        # anything overwritten (or being overwritten) while we copied is dropped
+        ok = (before == seqs) & (after == seqs)
+
+        self.dropped += int(len(seqs) - ok.sum())
+        self.next = stop
+        return records[ok]
+
+    # Block until something new arrives (or timeout seconds pass).
+    def wait(self, timeout=None, poll=0.001):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            records = self.read()
+            if len(records) or (deadline is not None and time.time() >= deadline):
+                return records
+            time.sleep(poll)
+
+    def close(self):
+        self.mm.close()
+
+
+# Latest quote / bar per (venue, symbol), kept up to date from a reader.
+class LatestQuotes(object):
+    def __init__(self, reader):
+        self.reader = reader
+        self.latest = {}
+
+    def update(self):
+        for record in self.reader.read():
+            key = (record['venue'].decode(), record['symbol'].decode())
+            self.latest[key] = record
+        return self.latest
+
+    def price(self, venue, symbol):
+        record = self.latest.get((venue, symbol))
+        return None if record is None else float(record['close'])
+
+
+# Sources: generators of RECORD_DTYPE arrays for FeedWriter.publish
+
+# Quotes (from book snapshots) and trades (as 1 tick bars) from recorded
+# tick_replay files, in timestamp order. speed=None replays as fast as
+# possible, otherwise at speed x real time.
+def replay_source(replay, symbol, speed=None):
+    start_wall = time.time()
+    start_ts = None
+
+    for batch in replay.batches():
+        out = np.zeros(len(batch), dtype=RECORD_DTYPE)
+        out['ts'] = batch['ts']
+        out['symbol'] = symbol
+        for i, stream in enumerate(replay.streams):
+            mask = batch['stream'] == i
+            if not mask.any():
+                continue
+            records = stream.records[batch['index'][mask]]
+            out['venue'][mask] = stream.venue
+            if stream.kind == tick_replay.BOOK:
+                out['kind'][mask] = QUOTE
+                out['bid'][mask] = records['bid_price'][:, 0]
+                out['ask'][mask] = records['ask_price'][:, 0]
+                mid = (records['bid_price'][:, 0] + records['ask_price'][:, 0]) / 2
+                for field in ('open', 'high', 'low', 'close'):
+                    out[field][mask] = mid
+            else:
+                out['kind'][mask] = BAR
+                for field in ('open', 'high', 'low', 'close'):
+                    out[field][mask] = records['price']
+                out['volume'][mask] = records['amount']
+                out['bid'][mask] = np.nan
+                out['ask'][mask] = np.nan
+
+        if speed is not None:
+            if start_ts is None:
+                start_ts = out['ts'][0]
+            due = start_wall + (out['ts'][-1] - start_ts) / 1e9 / speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        yield out
+
+
+# Poll tickers through ccxt (what catalyst uses underneath). One request per
+# symbol per interval, however many strategies are reading.
+def ccxt_source(exchange_name, symbols, interval=5.0):
+    import ccxt
+
+    exchange = getattr(ccxt, exchange_name)()
+    markets = dict((s, s.upper().replace('_', '/')) for s in symbols)
+    while True:
+        started = time.time()
+        out = np.zeros(len(symbols), dtype=RECORD_DTYPE)
+        for i, symbol in enumerate(symbols):
+            ticker = exchange.fetch_ticker(markets[symbol])
+            out[i] = (int((ticker.get('timestamp') or started * 1000) * 1e6), QUOTE,
+                    exchange_name, symbol,
+                    ticker.get('open') or np.nan, ticker.get('high') or np.nan,
+                    ticker.get('low') or np.nan, ticker.get('last') or np.nan,
+                    ticker.get('baseVolume') or np.nan,
+                    ticker.get('bid') or np.nan, ticker.get('ask') or np.nan)
+        yield out
+        time.sleep(max(0.0, interval - (time.time() - started)))
+
+
+def run_feed(source, path=DEFAULT_PATH, capacity=1 << 16):
+    writer = FeedWriter(path, capacity)
+    try:
+        for records in source:
+            writer.publish(records)
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shared memory market data feed')
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--capacity', type=int, default=1 << 16)
+    sub = parser.add_subparsers(dest='source')
+
+    live = sub.add_parser('live', help='poll an exchange')
+    live.add_argument('--exchange', default='poloniex')
+    live.add_argument('--symbols', nargs='+', default=['btc_usdt', 'eth_btc'])
+    live.add_argument('--interval', type=float, default=5.0)
+
+    replay = sub.add_parser('replay', help='replay tick_replay recordings')
+    replay.add_argument('--stream', action='append', required=True,
+            help='venue:kind:path, kind is book or trades')
+    replay.add_argument('--symbol', default='eth_btc')
+    replay.add_argument('--speed', type=float, help='x real time, default as fast as possible')
+
+    args = parser.parse_args(argv)
+
+    if args.source == 'live':
+        source = ccxt_source(args.exchange, args.symbols, args.interval)
+    elif args.source == 'replay':
+        streams = []
+        for spec in args.stream:
+            venue, kind, path = spec.split(':', 2)
+            streams.append(tick_replay.Stream(path, venue, kind))
+        source = replay_source(tick_replay.Replay(streams), args.symbol, args.speed)
+    else:
+        parser.print_help()
+        return
+
+    run_feed(source, args.path, args.capacity)
+
+
+if __name__ == '__main__':
+    main()
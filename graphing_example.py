@@ -1,10 +1,11 @@
 from catalyst.api import symbol, record, order
 from catalyst import run_algorithm
-import matplotlib.pyplot as plt
 import numpy as np
 
 import pandas as pd
 
+import sparse
+
 def initialize(context):
     context.asset = symbol('btc_usdt')
     context.bought = False
@@ -24,7 +25,43 @@ def handle_data(context, data):
         context.sold = True
 
 
+# Sparse version of handle_data (see sparse.py). The only bars where anything can
+# happen are the first time price goes above 5900 and the first time it goes
+# above 6200, so we only get called on those two.
+def sparse_events(prices):
+    return sparse.merge_events(
+            sparse.first_crossing(prices, 5900),
+            sparse.first_crossing(prices, 6200),
+            )
+
+
+def handle_event(context, bar):
+    if not context.bought and bar.price > 5900:
+        context.order(1)
+        context.bought = True
+
+    if context.bought and not context.sold and bar.price > 6200:
+        context.order(-1)
+        context.sold = True
+
+
+def initialize_sparse(context):
+    context.bought = False
+    context.sold = False
+
+
+def run_sparse(prices, capital_base=10000):
+    return sparse.run_sparse(prices,
+            sparse_events(prices),
+            handle_event,
+            capital_base=capital_base,
+            initialize=initialize_sparse,
+            )
+
+
 def analyze(context, perf):
+    import matplotlib.pyplot as plt
+
     exchange = list(context.exchanges.values())[0]
     quote_currency = exchange.quote_currency.upper()
 
@@ -0,0 +1,164 @@
+import argparse
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+
+import indicators
+
+# Correctness and speed harness for the indicator implementations.
+#
+# rsi_example, macd_example and momentum each compute their indicator a
+# different way. This runs every implementation of an indicator on the same
+# fixture series, checks they agree within tolerance and records how fast each
+# one is and how much it allocates per call, so switching the one used on the
+# hot path is a measured decision.
+#
+#   python indicator_harness.py
+#   python indicator_harness.py --bars 100000 --repeat 3
+#
+# Exits with status 1 if any implementation disagrees with its reference.
+# talib implementations are skipped if talib isn't installed.
+
+Implementation = namedtuple('Implementation', ['name', 'fn'])
+Group = namedtuple('Group', ['name', 'implementations', 'burn_in', 'rtol', 'atol'])
+
+
+def _stream(cls, **kwargs):
+    return lambda prices: indicators.run_stream(cls(**kwargs), prices)
+
+
+# The first implementation in each group is the reference the others are
+# checked against. burn_in skips bars where implementations legitimately
+# differ (e.g. talib vs pandas ewm seeding).
+GROUPS = [
+    Group('rsi (simple, rsi_example)', [
+        Implementation('pandas', lambda p: indicators.rsi_pandas(p, 14)),
+        Implementation('numpy', lambda p: indicators.rsi(p, 14)),
+        Implementation('streaming', _stream(indicators.RsiStream, period=14)),
+    ], 0, 1e-7, 1e-7),
+    Group('rsi (wilder)', [
+        Implementation('pandas', lambda p: indicators.rsi_wilder(p, 14)),
+        Implementation('talib', lambda p: indicators.rsi_wilder_talib(p, 14)),
+        Implementation('streaming', _stream(indicators.WilderRsiStream, period=14)),
+    ], 0, 1e-7, 1e-7),
+    Group('macd (macd_example)', [
+        Implementation('pandas', lambda p: indicators.macd_pandas(p)),
+        Implementation('talib', lambda p: indicators.macd_talib(p)),
+        Implementation('streaming', _stream(indicators.MacdStream)),
+    ], 300, 1e-4, 1e-6),
+    Group('momentum (momentum.py)', [
+        Implementation('pandas', lambda p: indicators.momentum_pandas(p, 20)),
+        Implementation('numpy', lambda p: indicators.momentum(p, 20)),
+        Implementation('streaming', _stream(indicators.MomentumStream, look_back_window=20)),
+    ], 0, 1e-9, 1e-9),
+]
+
+
+# Deterministic price series covering the awkward cases as well as a normal
+# random walk.
+def fixtures(bars=5000, seed=0):
+    rng = np.random.RandomState(seed)
+    walk = 4000 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    steps = np.repeat(4000 + 10 * np.arange(bars // 50 + 1), 50)[:bars].astype(float)
+    return {
+        'random_walk': walk,
+        'trending_up': np.linspace(1000, 20000, bars),
+        'flat_then_moving': np.r_[np.full(bars // 2, 5000.0), walk[:bars - bars // 2]],
+        'steps': steps,
+    }
+
+
+def _as_tuple(result):
+    return result if isinstance(result, tuple) else (result,)
+
+
+def compare(reference, candidate, burn_in, rtol, atol):
+    worst = 0.0
+    ok = True
+    for ref, got in zip(_as_tuple(reference), _as_tuple(candidate)):
+        ref = np.asarray(ref, dtype=float)[burn_in:]
+        got = np.asarray(got, dtype=float)[burn_in:]
+        if ref.shape != got.shape:
+            return False, np.inf
+        if not np.allclose(ref, got, rtol=rtol, atol=atol, equal_nan=True):
+            ok = False
+        both = ~np.isnan(ref) & ~np.isnan(got)
+        if both.any():
+            worst = max(worst, float(np.max(np.abs(ref[both] - got[both]))))
+        if (np.isnan(ref) != np.isnan(got)).any():
+            ok = False
+    return ok, worst
+
+
+# Best of `repeat` wall times, and peak bytes allocated during one call.
+def measure(fn, prices, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(prices)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(prices)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(bars=5000, repeat=5, seed=0):
+    series = fixtures(bars, seed)
+    rows = []
+    failures = []
+
+    for group in GROUPS:
+        for fixture, prices in sorted(series.items()):
+            reference = None
+            for impl in group.implementations:
+                try:
+                    result = impl.fn(prices)
+                except ImportError:
+                    rows.append((group.name, fixture, impl.name, 'skipped', np.nan, np.nan, np.nan))
+                    continue
+
+                if reference is None:
+                    reference = result
+                    ok, worst = True, 0.0
+                else:
+                    ok, worst = compare(reference, result, group.burn_in, group.rtol, group.atol)
+                if not ok:
+                    failures.append((group.name, fixture, impl.name, worst))
+
+                seconds, peak = measure(impl.fn, prices, repeat)
+                rows.append((group.name, fixture, impl.name, 'ok' if ok else 'MISMATCH',
+                        worst, len(prices) / seconds, peak))
+
+    return rows, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check indicator implementations agree and time them')
+    parser.add_argument('--bars', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rows, failures = run(args.bars, args.repeat, args.seed)
+
+    print("{:<28} {:<18} {:<10} {:<9} {:>12} {:>14} {:>12}".format(
+        'indicator', 'fixture', 'impl', 'status', 'max abs diff', 'bars/s', 'peak bytes'))
+    for group, fixture, impl, status, worst, rate, peak in rows:
+        print("{:<28} {:<18} {:<10} {:<9} {:>12.3g} {:>14,.0f} {:>12,.0f}".format(
+            group, fixture, impl, status, worst, rate, peak))
+
+    if failures:
+        print("")
+        for group, fixture, impl, worst in failures:
+            print("MISMATCH: {} / {} / {} (max abs diff {:.3g})".format(group, fixture, impl, worst))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import numpy as np
+import pandas as pd
+
+# Batched indicators. Each function computes the indicator for a whole vector of
+# periods at once and returns a (time x period) array, so we can look at how
+# sensitive a strategy is to its period without running one backtest per value.
+
+# rsi_batch works through the bars in chunks of about this many cells
+CHUNK_ELEMENTS = 1 << 18
+
+
+# RSI the way rsi_example computes it: plain sums of the up and down moves over
+# the last `period` prices (no Wilder smoothing). Column j holds the RSI for
+# periods[j], rows before a period has enough data are NaN.
+#
+# Uses cumulative sums of gains and losses so every (bar, period) cell is just a
+# difference of two cumsum entries, no per-period loop. dtype only sets the
+# output array (see compact.py), the cumsums stay float64 so they don't drift.
+def rsi_batch(prices, periods, dtype=np.float64):
+    prices = np.asarray(prices, dtype=float)
+    periods = np.atleast_1d(np.asarray(periods, dtype=np.int64))
+    n = len(prices)
+    out = np.full((n, len(periods)), np.nan, dtype=dtype)
+    if n < 2:
+        return out
+
+    deltas = np.diff(prices)
+    gains = np.r_[0.0, np.cumsum(np.where(deltas > 0, deltas, 0.0))]
+    losses = np.r_[0.0, np.cumsum(np.where(deltas < 0, -deltas, 0.0))]
+
+    # Chunked over time so out is the only full (time x period) array, the
+    # temporaries are a chunk at a time whatever dtype is.
+    chunk = max(1, CHUNK_ELEMENTS // len(periods))
+    for lo in range(0, n, chunk):
+        # A window of `period` prices has period - 1 deltas
+        t = np.arange(lo, min(n, lo + chunk))[:, None]
+        start = t - (periods[None, :] - 1)
+        valid = start >= 0
+        start = np.where(valid, start, 0)
+
+        up = gains[t] - gains[start]
+        down = losses[t] - losses[start]
+
+        # up / (up + down) is the same as 100 - 100 / (1 + RS) without the inf
+        # when there were no down moves. No moves at all is still NaN.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = 100.0 * up / (up + down)
+
+        block = out[lo:lo + len(t)]
+        block[valid] = rsi[valid]
+    return out
+
+
+# Single period RSI series, same numbers as the block in rsi_example.
+def rsi(prices, period=14):
+    return rsi_batch(prices, [period])[:, 0]
+
+
+# Everything below computes the same indicators other ways, so
+# indicator_harness.py can check they agree and time them. Each returns one
+# value per bar with NaN until there's enough data.
+
+
+# rsi_example's original pandas code, run on every window. The slow reference.
+def rsi_pandas(prices, period=14):
+    prices = pd.Series(np.asarray(prices, dtype=float))
+
+    def window_rsi(window):
+        deltas = pd.Series(window).diff()
+        seed = deltas[:period + 1]
+        up = seed[seed >= 0].sum() / period
+        down = -seed[seed < 0].sum() / period
+        return 100 - (100 / (1 + up / down)) if down else (100.0 if up else np.nan)
+
+    return prices.rolling(period).apply(window_rsi).values
+
+
+# Wilder smoothed RSI, what talib.RSI computes: seeded with the simple average
+# of the first `period` moves, then avg = (avg * (period - 1) + move) / period,
+# which is an ewm with alpha = 1 / period.
+def rsi_wilder(prices, period=14):
+    prices = np.asarray(prices, dtype=float)
+    out = np.full(len(prices), np.nan)
+    if len(prices) <= period:
+        return out
+
+    deltas = np.diff(prices)
+    gains = np.where(deltas > 0, deltas, 0.0)
+    losses = np.where(deltas < 0, -deltas, 0.0)
+
+    def smooth(moves):
+        seeded = moves[period - 1:].copy()
+        seeded[0] = moves[:period].mean()
+        return pd.Series(seeded).ewm(alpha=1.0 / period, adjust=False).mean().values
+
+    up = smooth(gains)
+    down = smooth(losses)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[period:] = 100.0 * up / (up + down)
+    return out
+
+
+def rsi_wilder_talib(prices, period=14):
+    import talib as ta
+    return ta.RSI(np.asarray(prices, dtype=float), timeperiod=period)
+
+
+# MACD line, signal line and histogram with pandas ewm (seeded with the first
+# price). talib seeds with a simple average instead, so the two only agree once
+# the seed has decayed.
+def macd_pandas(prices, fastperiod=12, slowperiod=26, signalperiod=9):
+    prices = pd.Series(np.asarray(prices, dtype=float))
+    macd = (prices.ewm(span=fastperiod, adjust=False).mean()
+            - prices.ewm(span=slowperiod, adjust=False).mean())
+    signal = macd.ewm(span=signalperiod, adjust=False).mean()
+    return macd.values, signal.values, (macd - signal).values
+
+
+# What macd_example calls
+def macd_talib(prices, fastperiod=12, slowperiod=26, signalperiod=9):
+    import talib as ta
+    return ta.MACD(np.asarray(prices, dtype=float),
+            fastperiod=fastperiod, slowperiod=slowperiod, signalperiod=signalperiod)
+
+
+# Percent change over the look back window, like momentum.py's
+# pct_change(look_back_window - 1) * 100
+def momentum_pandas(prices, look_back_window=20):
+    return pd.Series(np.asarray(prices, dtype=float)).pct_change(look_back_window - 1).values * 100
+
+
+def momentum(prices, look_back_window=20):
+    prices = np.asarray(prices, dtype=float)
+    lag = look_back_window - 1
+    out = np.full(len(prices), np.nan)
+    out[lag:] = (prices[lag:] / prices[:-lag] - 1) * 100
+    return out
+
+
+# Streaming versions: O(1) work per new price, for use inside handle_data
+# instead of recomputing over a history window every bar.
+
+class RsiStream(object):
+    # Same numbers as rsi() / rsi_example
+    def __init__(self, period=14):
+        self.period = period
+        self.deltas = np.zeros(period - 1)
+        self.count = 0
+        self.last = None
+        self.up = 0.0
+        self.down = 0.0
+
+    def update(self, price):
+        if self.last is not None:
+            delta = price - self.last
+            slot = (self.count - 1) % len(self.deltas)
+            if self.count > len(self.deltas):
+                old = self.deltas[slot]
+                if old > 0:
+                    self.up -= old
+                else:
+                    self.down += old
+            self.deltas[slot] = delta
+            if delta > 0:
+                self.up += delta
+            else:
+                self.down -= delta
+        self.last = price
+        self.count += 1
+
+        if self.count < self.period:
+            return np.nan
+        total = self.up + self.down
+        return 100.0 * self.up / total if total > 0 else np.nan
+
+
+class WilderRsiStream(object):
+    # Same numbers as rsi_wilder() / talib.RSI
+    def __init__(self, period=14):
+        self.period = period
+        self.count = 0
+        self.last = None
+        self.up = 0.0
+        self.down = 0.0
+
+    def update(self, price):
+        if self.last is None:
+            self.last = price
+            return np.nan
+
+        delta = price - self.last
+        self.last = price
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        self.count += 1
+
+        if self.count <= self.period:
+            # still building the simple average seed
+            self.up += gain / self.period
+            self.down += loss / self.period
+            if self.count < self.period:
+                return np.nan
+        else:
+            self.up += (gain - self.up) / self.period
+            self.down += (loss - self.down) / self.period
+
+        total = self.up + self.down
+        return 100.0 * self.up / total if total > 0 else np.nan
+
+
+class MacdStream(object):
+    # Same numbers as macd_pandas()
+    def __init__(self, fastperiod=12, slowperiod=26, signalperiod=9):
+        self.alphas = (2.0 / (fastperiod + 1), 2.0 / (slowperiod + 1), 2.0 / (signalperiod + 1))
+        self.fast = self.slow = self.signal = None
+
+    def update(self, price):
+        a_fast, a_slow, a_signal = self.alphas
+        if self.fast is None:
+            self.fast = self.slow = price
+        else:
+            self.fast += a_fast * (price - self.fast)
+            self.slow += a_slow * (price - self.slow)
+
+        macd = self.fast - self.slow
+        if self.signal is None:
+            self.signal = macd
+        else:
+            self.signal += a_signal * (macd - self.signal)
+        return macd, self.signal, macd - self.signal
+
+
+class MomentumStream(object):
+    # Same numbers as momentum()
+    def __init__(self, look_back_window=20):
+        self.lag = look_back_window - 1
+        self.prices = np.zeros(self.lag)
+        self.count = 0
+
+    def update(self, price):
+        slot = self.count % self.lag
+        old = self.prices[slot]
+        self.prices[slot] = price
+        self.count += 1
+        if self.count <= self.lag:
+            return np.nan
+        return (price / old - 1) * 100
+
+
+# Run a streaming indicator over a whole series, one update per price.
+def run_stream(stream, prices):
+    values = [stream.update(p) for p in np.asarray(prices, dtype=float)]
+    if values and isinstance(values[0], tuple):
+        return tuple(np.array(v) for v in zip(*values))
+    return np.array(values)
@@ -1,7 +1,6 @@
 from catalyst.api import symbol, record, order_target_percent, get_datetime, commission, slippage
 from catalyst.exchange.utils.stats_utils import extract_transactions
 from catalyst import run_algorithm
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import talib as ta
@@ -86,6 +85,8 @@ def handle_data(context, data):
         #  order_target_percent(context.asset, -1)
 
 def analyze(context, perf):
+    import matplotlib.pyplot as plt
+
     exchange = list(context.exchanges.values())[0]
     quote_currency = exchange.quote_currency.upper()
 
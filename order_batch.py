@@ -0,0 +1,333 @@
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Submit every leg of an arbitrage at once.
+#
+# arbitrage.handle_data places the binance leg and then the poloniex leg, so in
+# live trading the second leg goes out a full round trip after the first, just
+# when the spread is closing. An OrderBatch sends all legs at the same time on a
+# thread pool and waits for all the acknowledgements together. Every leg's
+# latency is recorded per venue.
+#
+# Once every leg has acked, the fills are reconciled: anything still open is
+# cancelled, and a leg that filled more than the others has the excess
+# reversed with a market order, so the position is the same size on every
+# venue. If any leg is rejected or doesn't ack in time, the legs that did ack
+# are unwound completely the same way. A leg that acks after the timeout is
+# unwound as soon as its ack arrives (see late_unwinds).
+#
+#   batch = OrderBatch({
+#       'binance': CatalystVenue(context, context.binance),
+#       'poloniex': CatalystVenue(context, context.poloniex),
+#   })
+#   result = batch.submit([
+#       Leg('binance', context.binance_trading_pair, 1, binance_price),
+#       Leg('poloniex', context.poloniex_trading_pair, -1, poloniex_price),
+#   ])
+#   batch.reconcile()   # on the algorithm thread, hands the orders to the blotter
+#
+# A venue is anything with submit(leg) -> order id (raising if the order is
+# rejected) and cancel(leg, order_id) -> amount filled before the cancel.
+# MockExchange is one for testing without a network:
+#
+#   python order_batch.py
+
+# limit_price None means a market order
+Leg = namedtuple('Leg', ['venue', 'asset', 'amount', 'limit_price'])
+
+LegResult = namedtuple('LegResult', ['leg', 'order_id', 'error', 'latency'])
+
+# matched is the fraction of every leg left in place once the fills are
+# reconciled, 1.0 if they all filled completely
+BatchResult = namedtuple('BatchResult', ['legs', 'unwinds', 'ok', 'matched', 'latency'])
+
+
+class LegTimeout(Exception):
+    pass
+
+
+class LatencyStats(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, venue, seconds):
+        with self._lock:
+            self.samples.setdefault(venue, []).append(seconds)
+
+    # venue -> (count, mean, p50, p99, max) in milliseconds
+    def summary(self):
+        out = {}
+        with self._lock:
+            for venue, samples in self.samples.items():
+                ordered = sorted(samples)
+                n = len(ordered)
+                out[venue] = (
+                        n,
+                        1000 * sum(ordered) / n,
+                        1000 * ordered[n // 2],
+                        1000 * ordered[min(n - 1, int(n * 0.99))],
+                        1000 * ordered[-1],
+                        )
+        return out
+
+
+class OrderBatch(object):
+    # venues is venue name -> venue. timeout is how long to wait for all acks
+    # before treating the missing ones as failed. A reversing order that's
+    # rejected is resent up to reverse_attempts times in all.
+    def __init__(self, venues, timeout=5.0, max_workers=8, reverse_attempts=5):
+        self.venues = venues
+        self.timeout = timeout
+        self.reverse_attempts = reverse_attempts
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.latency = LatencyStats()
+        self._lock = threading.Lock()
+        # unwinds of legs whose ack arrived after their batch had given up
+        self.late_unwinds = []
+
+    def _send(self, leg):
+        start = time.perf_counter()
+        try:
+            order_id = self.venues[leg.venue].submit(leg)
+            error = None
+        except Exception as e:
+            order_id = None
+            error = e
+        latency = time.perf_counter() - start
+        self.latency.add(leg.venue, latency)
+        return LegResult(leg, order_id, error, latency)
+
+    # Cancel whatever of an acked leg is still open. Returns how much of it
+    # filled, or the exception if the venue couldn't say.
+    def _cancel(self, result):
+        leg = result.leg
+        try:
+            return self.venues[leg.venue].cancel(leg, result.order_id)
+        except Exception as e:
+            return e
+
+    # Market order taking `amount` of a leg's fill back out, retried if the
+    # venue rejects it since the position is unhedged until it goes through.
+    def _reverse(self, leg, amount):
+        for _ in range(self.reverse_attempts):
+            result = self._send(Leg(leg.venue, leg.asset, -amount, None))
+            if result.error is None:
+                break
+        return result
+
+    # Cancel an acked leg and reverse whatever of it filled. Returns the
+    # LegResult of the reversing order, or None if nothing had filled.
+    def _unwind(self, result):
+        leg = result.leg
+        filled = self._cancel(result)
+        if isinstance(filled, Exception):
+            # can't tell how much filled, so don't guess at a reversal
+            return LegResult(Leg(leg.venue, leg.asset, 0, None), None, filled, 0.0)
+        if not filled:
+            return None
+        return self._reverse(leg, filled)
+
+    def _unwind_late(self, future):
+        result = future.result()
+        if result.error is not None:
+            return
+        unwind = self._unwind(result)
+        with self._lock:
+            self.late_unwinds.append((result, unwind))
+
+    def _send_all(self, legs):
+        futures = [self.executor.submit(self._send, leg) for leg in legs]
+        done, _ = wait(futures, timeout=self.timeout)
+
+        results = []
+        for leg, future in zip(legs, futures):
+            if future in done:
+                results.append(future.result())
+            else:
+                # if it acks after all, take it straight back out
+                future.add_done_callback(self._unwind_late)
+                results.append(LegResult(leg, None, LegTimeout('no ack after {}s'.format(self.timeout)),
+                    self.timeout))
+        return results
+
+    # Send every leg at once. Once they have all acked, whatever is still open
+    # is cancelled and the legs are trimmed to the same filled fraction: the
+    # excess of any leg that filled more than the least filled one is reversed,
+    # so the venues stay hedged against each other. If any leg fails, every
+    # acked leg is unwound completely (all in parallel) and ok is False.
+    def submit(self, legs):
+        start = time.perf_counter()
+        results = self._send_all(legs)
+        ok = all(r.error is None for r in results)
+        acked = [r for r in results if r.error is None]
+        filled = list(self.executor.map(self._cancel, acked))
+
+        unwinds = [LegResult(Leg(r.leg.venue, r.leg.asset, 0, None), None, f, 0.0)
+                for r, f in zip(acked, filled) if isinstance(f, Exception)]
+        if unwinds:
+            # a leg whose fill is unknown can't be matched, back everything out
+            ok = False
+        matched = 0.0
+        if ok:
+            matched = min(min(max(f / float(r.leg.amount), 0.0), 1.0) for r, f in zip(acked, filled))
+
+        excess = [(r.leg, f - matched * r.leg.amount) for r, f in zip(acked, filled)
+                if not isinstance(f, Exception)]
+        futures = [self.executor.submit(self._reverse, leg, amount) for leg, amount in excess if amount]
+        unwinds += [f.result() for f in futures]
+
+        return BatchResult(results, unwinds, ok and matched > 0, matched, time.perf_counter() - start)
+
+    # Pass orders placed from the worker threads on to anything that has to be
+    # told about them on the caller's thread (CatalystVenue's blotter).
+    def reconcile(self):
+        for venue in self.venues.values():
+            if hasattr(venue, 'reconcile'):
+                venue.reconcile()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+# A catalyst exchange in live mode. Orders go straight to the exchange from
+# the worker threads, so the blotter doesn't see them; reconcile() (called on
+# the algorithm thread) adds them to it the same way blotter.order would, after
+# which they show up in open_orders and their fills in context.portfolio.
+class CatalystVenue(object):
+    def __init__(self, context, exchange):
+        self.blotter = context.blotter
+        self.exchange = exchange
+        self._lock = threading.Lock()
+        self._placed = []
+
+    def submit(self, leg):
+        from catalyst.finance.execution import LimitOrder, MarketOrder
+
+        style = MarketOrder() if leg.limit_price is None else LimitOrder(leg.limit_price)
+        order = self.exchange.order(leg.asset, leg.amount, style)
+        with self._lock:
+            self._placed.append(order)
+        return order.id
+
+    def cancel(self, leg, order_id):
+        order = self.exchange.get_order(order_id, leg.asset)
+        if order.open:
+            self.exchange.cancel_order(order_id, leg.asset)
+            order = self.exchange.get_order(order_id, leg.asset)
+        return order.filled
+
+    def reconcile(self):
+        with self._lock:
+            placed, self._placed = self._placed, []
+        for order in placed:
+            self.blotter.open_orders[order.asset].append(order)
+            self.blotter.orders[order.id] = order
+            self.blotter.new_orders.append(order)
+
+
+# Local stand in for an exchange. Acks after a random latency. Market orders
+# always go through and fill completely; a limit order is rejected with
+# probability reject_rate, and otherwise fills completely with probability
+# fill_rate or only partly (maybe not at all) until it's cancelled.
+class MockExchange(object):
+    def __init__(self, name, latency=(0.05, 0.15), reject_rate=0.0, fill_rate=1.0, seed=None):
+        self.name = name
+        self.latency = latency
+        self.reject_rate = reject_rate
+        self.fill_rate = fill_rate
+        self.random = random.Random(seed)
+        self.orders = {}
+        self._lock = threading.Lock()
+
+    def submit(self, leg):
+        with self._lock:
+            delay = self.random.uniform(*self.latency)
+            reject = leg.limit_price is not None and self.random.random() < self.reject_rate
+            if leg.limit_price is None or self.random.random() < self.fill_rate:
+                filled = leg.amount
+            else:
+                filled = leg.amount * self.random.choice([0, 0.25, 0.5])
+        time.sleep(delay)
+        if reject:
+            raise RuntimeError('{} rejected {} {}'.format(self.name, leg.amount, leg.asset))
+        with self._lock:
+            order_id = '{}-{}'.format(self.name, len(self.orders) + 1)
+            self.orders[order_id] = [leg, filled, 'open' if filled != leg.amount else 'filled']
+        return order_id
+
+    def cancel(self, leg, order_id):
+        with self._lock:
+            order = self.orders[order_id]
+            if order[2] == 'open':
+                order[2] = 'cancelled'
+            return order[1]
+
+    # Net filled position per asset
+    def positions(self):
+        out = {}
+        with self._lock:
+            for leg, filled, _ in self.orders.values():
+                out[leg.asset] = out.get(leg.asset, 0) + filled
+        return out
+
+
+# Run batches against mock exchanges through the accept, reject, partial fill
+# and timeout paths and check the net exposure across venues is zero.
+def check(batches=20, seed=0):
+    scenarios = [
+        ('accept', dict(), dict(), 1.0),
+        ('reject', dict(), dict(reject_rate=0.5), 1.0),
+        ('partial fills', dict(), dict(reject_rate=0.5), 0.3),
+        ('timeout', dict(), dict(latency=(0.3, 0.3)), 1.0),
+    ]
+    failures = []
+    for name, binance_kwargs, poloniex_kwargs, fill_rate in scenarios:
+        binance = MockExchange('binance', latency=(0.01, 0.05), fill_rate=fill_rate, seed=seed,
+                **binance_kwargs)
+        poloniex = MockExchange('poloniex', **dict(dict(latency=(0.01, 0.05), fill_rate=fill_rate,
+            seed=seed + 1), **poloniex_kwargs))
+        batch = OrderBatch({'binance': binance, 'poloniex': poloniex}, timeout=0.1)
+
+        results = [batch.submit([
+            Leg('binance', 'eth_btc', 1, 0.07),
+            Leg('poloniex', 'eth_btc', -1, 0.071),
+        ]) for _ in range(batches)]
+        # let late acks arrive and be unwound
+        batch.close()
+
+        # whatever went through, both venues must hold the same size in
+        # opposite directions
+        b = binance.positions().get('eth_btc', 0)
+        p = poloniex.positions().get('eth_btc', 0)
+        if abs(b + p) > 1e-9:
+            failures.append(name)
+
+        ok = sum(r.ok for r in results)
+        print("{:<14} {:>3}/{} ok  unwinds {:>3}  late unwinds {:>3}  binance {:+.2f}  poloniex {:+.2f}".format(
+            name, ok, batches, sum(len(r.unwinds) for r in results), len(batch.late_unwinds), b, p))
+        for venue, (n, mean, p50, p99, worst) in sorted(batch.latency.summary().items()):
+            print("    {:<10} {:>4} orders  mean {:6.1f} ms  p50 {:6.1f}  p99 {:6.1f}  max {:6.1f}".format(
+                venue, n, mean, p50, p99, worst))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exercise OrderBatch against mock exchanges')
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    failures = check(args.batches, args.seed)
+    if failures:
+        print("\nleft exposed after: {}".format(', '.join(failures)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Cross exchange pairs / spread tracking.
+#
+# arbitrage.py compares the binance and poloniex eth_btc prices through a fixed
+# 3% slippage band. Here the relationship between two venues is learnt online
+# instead: a Kalman filter tracks the hedge ratio and offset of
+#
+#   log(price_a) = beta * log(price_b) + alpha + noise
+#
+# Logs make it scale free, eth_btc at 0.05 behaves like btc_usdt at 5000. The
+# noise variance isn't a constant either, it's learnt from the innovations as
+# they come in. Each update's innovation is the spread, and its z-score is taken
+# against an exponentially weighted mean and variance of the spreads before it.
+# Everything is a handful of float operations, O(1) per bar no matter how long
+# it has been running.
+#
+#   book = PairsBook(entry=4.0, exit=0.5)
+#   signals = book.update({'binance': binance_price, 'poloniex': poloniex_price})
+#   signals[('binance', 'poloniex')]  # +1 long spread, -1 short spread, 0 flat
+
+
+# Exponentially weighted mean / variance, updated one value at a time.
+class EwStats(object):
+    def __init__(self, span):
+        self.weight = 2.0 / (span + 1)
+        self.mean = np.nan
+        self.variance = np.nan
+
+    def update(self, x):
+        if np.isnan(self.mean):
+            self.mean = x
+            self.variance = 0.0
+            return
+        diff = x - self.mean
+        increment = self.weight * diff
+        self.mean += increment
+        self.variance = (1 - self.weight) * (self.variance + diff * increment)
+
+
+class KalmanPair(object):
+    # delta sets how fast the hedge may drift (bigger = adapts faster, and
+    # absorbs more of a dislocation). obs_var fixes the noise variance (in log
+    # units); by default it's learnt as an EW average over noise_span updates.
+    # The z-score uses the spreads of the last ~zscore_span updates.
+    def __init__(self, delta=1e-8, obs_var=None, noise_span=500, zscore_span=500, beta=1.0, alpha=0.0):
+        self.beta = beta
+        self.alpha = alpha
+        self.drift = delta / (1 - delta)
+        self.fixed_obs_var = obs_var
+        # until there's something to learn from, 0.1% noise
+        self.obs_var = 1e-6 if obs_var is None else obs_var
+        self.noise_weight = 2.0 / (noise_span + 1)
+        self.spreads = EwStats(zscore_span)
+
+        # state covariance, symmetric 2x2 over (beta, alpha)
+        self.p00 = 1.0
+        self.p01 = 0.0
+        self.p11 = 1.0
+
+        self.spread = np.nan
+        self.variance = np.nan
+        self.zscore = np.nan
+        self.updates = 0
+
+    # Feed one (price_a, price_b) observation, returns the z-score of the spread
+    # against the hedge predicted before seeing it.
+    def update(self, a, b):
+        a = math.log(a)
+        b = math.log(b)
+        p00 = self.p00 + self.drift
+        p01 = self.p01
+        p11 = self.p11 + self.drift
+
+        spread = a - (self.beta * b + self.alpha)
+        pf0 = p00 * b + p01
+        pf1 = p01 * b + p11
+        state_var = b * pf0 + pf1
+        variance = state_var + self.obs_var
+
+        k0 = pf0 / variance
+        k1 = pf1 / variance
+        self.beta += k0 * spread
+        self.alpha += k1 * spread
+
+        self.p00 = p00 - k0 * pf0
+        self.p01 = p01 - k0 * pf1
+        self.p11 = p11 - k1 * pf1
+
+        if self.fixed_obs_var is None and self.updates:
+            # what the innovation's size says the noise is, less the part the
+            # state uncertainty accounts for (the first one is all state)
+            observed = max(spread * spread - state_var, 1e-12)
+            self.obs_var += self.noise_weight * (observed - self.obs_var)
+
+        # z against the spreads so far, then let this one in
+        stats = self.spreads
+        if self.updates > 1 and stats.variance > 0:
+            self.zscore = (spread - stats.mean) / math.sqrt(stats.variance)
+        else:
+            self.zscore = np.nan
+        stats.update(spread)
+
+        self.spread = spread
+        self.variance = variance
+        self.updates += 1
+        return self.zscore
+
+    def hedge(self):
+        return self.beta, self.alpha
+
+
+# z-score entry / exit on top of a KalmanPair.
+#   z >  entry: a is rich vs b, short the spread (sell a, buy beta of b) -> -1
+#   z < -entry: a is cheap, long the spread -> +1
+#   |z| < exit: flat
+# warmup updates are skipped while the filter settles. Venue noise is roughly
+# normal, so entry=2 would trade ~5% of bars on noise alone; 4 leaves only real
+# dislocations.
+class PairSignal(object):
+    def __init__(self, entry=4.0, exit=0.5, warmup=100, **kalman_kwargs):
+        self.filter = KalmanPair(**kalman_kwargs)
+        self.entry = entry
+        self.exit = exit
+        self.warmup = warmup
+        self.position = 0
+
+    def update(self, a, b):
+        z = self.filter.update(a, b)
+        if self.filter.updates <= self.warmup:
+            return self.position
+
+        if self.position == 0:
+            if z > self.entry:
+                self.position = -1
+            elif z < -self.entry:
+                self.position = 1
+        elif abs(z) < self.exit:
+            self.position = 0
+        return self.position
+
+
+# One PairSignal for every pair of venues seen, updated together each bar.
+class PairsBook(object):
+    def __init__(self, **signal_kwargs):
+        self.signal_kwargs = signal_kwargs
+        self.pairs = {}
+
+    # prices is venue -> price for this bar. Venues missing a price this bar
+    # keep their last state.
+    def update(self, prices):
+        venues = sorted(v for v, p in prices.items() if p is not None and not np.isnan(p))
+        signals = {}
+        for i, a in enumerate(venues):
+            for b in venues[i + 1:]:
+                key = (a, b)
+                if key not in self.pairs:
+                    self.pairs[key] = PairSignal(**self.signal_kwargs)
+                signals[key] = self.pairs[key].update(prices[a], prices[b])
+        return signals
+
+    def zscores(self):
+        return dict((key, signal.filter.zscore) for key, signal in self.pairs.items())
+
+
+# Run a PairSignal over two aligned series (e.g. perf.binance_price and
+# perf.poloniex_price from an arbitrage run) and return everything it tracked.
+def run_series(a, b, **signal_kwargs):
+    signal = PairSignal(**signal_kwargs)
+    rows = []
+    for pa, pb in zip(np.asarray(a, dtype=float), np.asarray(b, dtype=float)):
+        position = signal.update(pa, pb)
+        f = signal.filter
+        rows.append((f.beta, f.alpha, f.spread, f.variance, f.zscore, position))
+    return pd.DataFrame(rows,
+            index=getattr(a, 'index', None),
+            columns=['beta', 'alpha', 'spread', 'variance', 'zscore', 'position'])
@@ -0,0 +1,272 @@
+import argparse
+import json
+import numbers
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import compact
+
+# Columnar export of a run's perf, so it can be re-plotted or re-analyzed
+# without rerunning the backtest.
+#
+# perf's scalar columns go into one table, and each nested column
+# (transactions, positions, orders: a list of dicts per bar) is flattened into
+# its own table with one row per dict plus a `period` column saying which bar
+# it came from. Assets are stored by symbol.
+#
+# With pyarrow installed each table is an uncompressed Arrow IPC file, which
+# can be memory mapped. Without it each column is its own .npy file, memory
+# mapped with np.load. Either way only the columns asked for are touched:
+#
+#   python cli.py rsi --no-plot --export exports/rsi
+#
+#   export = PerfExport('exports/rsi')
+#   perf = export.perf(['portfolio_value', 'max_drawdown'])
+#   transactions = export.table('transactions')
+#
+#   python perf_export.py exports/rsi --columns portfolio_value max_drawdown
+#
+# export(..., mode='float32') or mode='fixed' stores perf's price columns
+# compactly (see compact.py), reading decodes them. results.ResultsStore keeps
+# its runs in this format too.
+
+ARROW = 'arrow'
+NPY = 'npy'
+
+PERF = 'perf'
+
+
+def _arrow():
+    try:
+        import pyarrow.feather
+    except ImportError:
+        return None
+    return pyarrow.feather
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+# Plain numpy array for an object column: numbers as float, timestamps as
+# UTC datetime64, assets by symbol and anything else as fixed width strings
+# (which, unlike object arrays, can be memory mapped).
+def _column_array(values):
+    values = np.asarray(values)
+    if values.dtype.kind in 'biufcmM':
+        return values
+
+    present = [v for v in values if not _is_missing(v)]
+    if not present:
+        return np.full(len(values), np.nan)
+    if present and all(isinstance(v, numbers.Number) and not isinstance(v, bool) for v in present):
+        return np.array([np.nan if _is_missing(v) else v for v in values], dtype=np.float64)
+    if present and all(isinstance(v, (pd.Timestamp, np.datetime64)) or hasattr(v, 'tzinfo') for v in present):
+        return pd.to_datetime(pd.Series(values), utc=True).values
+    if present and all(isinstance(v, (bool, np.bool_)) for v in present) and len(present) == len(values):
+        return values.astype(bool)
+
+    return np.array(['' if _is_missing(v) else str(getattr(v, 'symbol', v)) for v in values])
+
+
+def _is_nested(values):
+    return any(isinstance(v, list) for v in values)
+
+
+# One row per dict in a nested column, tagged with the bar it came from.
+def normalize(column):
+    periods = []
+    rows = []
+    for period, items in column.items():
+        for item in items or []:
+            periods.append(period)
+            rows.append(item)
+
+    keys = []
+    for row in rows:
+        for key in row:
+            if key not in keys:
+                keys.append(key)
+
+    table = {'period': _column_array(periods) if periods else np.array([], dtype='datetime64[ns]')}
+    for key in keys:
+        table[key] = _column_array([row.get(key) for row in rows])
+    return pd.DataFrame(table, columns=['period'] + keys)
+
+
+# perf -> {table name: flat frame}
+def tables(perf):
+    out = {}
+    scalar = {'period': _column_array(perf.index.values)}
+    order = ['period']
+    for column in perf.columns:
+        values = perf[column].values
+        if values.dtype == object and _is_nested(values):
+            out[column] = normalize(perf[column])
+        else:
+            scalar[column] = _column_array(values)
+            order.append(column)
+    out[PERF] = pd.DataFrame(scalar, columns=order)
+    return out
+
+
+def export(perf, path, format=None, mode=compact.FLOAT64):
+    compact.check_mode(mode)
+    feather = _arrow()
+    if format is None:
+        format = ARROW if feather is not None else NPY
+    if format == ARROW and feather is None:
+        raise ImportError("format='arrow' needs pyarrow, use format='npy' or pip install pyarrow")
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    # perf's own column order, nested columns included
+    meta = dict(format=format, tables={}, columns=[str(c) for c in perf.columns])
+    for name, frame in tables(perf).items():
+        modes = {}
+        if name == PERF and mode != compact.FLOAT64:
+            for column in compact.PRICE_COLUMNS:
+                if column in frame and frame[column].dtype.kind == 'f':
+                    frame[column] = compact.encode(frame[column].values, mode)
+                    modes[column] = mode
+
+        if format == ARROW:
+            filename = '{}.arrow'.format(name)
+            feather.write_feather(frame, os.path.join(path, filename), compression='uncompressed')
+            files = filename
+        else:
+            table_dir = os.path.join(path, name)
+            if not os.path.exists(table_dir):
+                os.makedirs(table_dir)
+            files = []
+            for i, column in enumerate(frame.columns):
+                filename = os.path.join(name, 'col_{}.npy'.format(i))
+                # newer pandas hands strings back as objects, turn them back into
+                # fixed width so the file can be memory mapped
+                np.save(os.path.join(path, filename), _column_array(frame[column].values))
+                files.append(filename)
+        meta['tables'][name] = dict(columns=list(frame.columns), rows=len(frame), files=files, modes=modes)
+
+    # meta.json last, it's what marks the export as complete
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return path
+
+
+# Timestamps are stored as naive UTC, like perf's own index
+def _localize(frame):
+    for column in frame.columns:
+        if frame[column].dtype.kind == 'M':
+            frame[column] = frame[column].dt.tz_localize('UTC')
+    return frame
+
+
+class PerfExport(object):
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.format = self.meta['format']
+
+    def tables(self):
+        return sorted(self.meta['tables'])
+
+    def columns(self, table=PERF):
+        return self.meta['tables'][table]['columns']
+
+    # One column as a (memory mapped where possible) numpy array.
+    def column(self, name, table=PERF):
+        return self._read(table, [name])[name]
+
+    def _read(self, table, columns):
+        entry = self.meta['tables'][table]
+        missing = [c for c in columns if c not in entry['columns']]
+        if missing:
+            raise KeyError("{} not in {} (have: {})".format(', '.join(missing), table, ', '.join(entry['columns'])))
+
+        if self.format == ARROW:
+            feather = _arrow()
+            if feather is None:
+                raise ImportError("{} was exported with pyarrow, which isn't installed".format(self.path))
+            arrow_table = feather.read_table(os.path.join(self.path, entry['files']),
+                    columns=columns, memory_map=True)
+            out = dict((c, arrow_table.column(c).to_numpy()) for c in columns)
+        else:
+            out = {}
+            for column in columns:
+                filename = entry['files'][entry['columns'].index(column)]
+                out[column] = np.load(os.path.join(self.path, filename), mmap_mode='r')
+
+        for column, mode in entry.get('modes', {}).items():
+            if column in out and mode == compact.FIXED:
+                out[column] = compact.decode(out[column], mode)
+        return out
+
+    # A flattened table (transactions, positions, orders, or perf itself) as a
+    # frame. columns=None reads all of them.
+    def table(self, name, columns=None):
+        columns = self.columns(name) if columns is None else list(columns)
+        data = self._read(name, columns)
+        return _localize(pd.DataFrame(data, columns=columns))
+
+    # A nested column (transactions, positions, orders) rebuilt as a list of
+    # dicts per bar of index, the way catalyst hands it out. Missing values
+    # come back as None.
+    def nested(self, name, index):
+        table = self.table(name)
+        rows = [[] for _ in range(len(index))]
+        if len(table):
+            positions = index.searchsorted(table['period'])
+            fields = [c for c in table.columns if c != 'period']
+            for position, values in zip(positions, zip(*[table[c].tolist() for c in fields])):
+                rows[position].append(dict((field, None if _is_missing(v) or v == '' else v)
+                    for field, v in zip(fields, values)))
+        return rows
+
+    # perf indexed by bar like the original. columns=None is every column,
+    # nested ones included; the nested ones are rebuilt from their tables
+    # only when asked for.
+    def perf(self, columns=None):
+        if columns is None:
+            columns = self.meta.get('columns') or [c for c in self.columns(PERF) if c != 'period']
+        columns = list(columns)
+        scalar = [c for c in columns if c not in self.meta['tables'] or c == PERF]
+        data = self._read(PERF, ['period'] + [c for c in scalar if c != 'period'])
+        index = pd.DatetimeIndex(data.pop('period')).tz_localize('UTC')
+        for column in columns:
+            if column not in data:
+                data[column] = self.nested(column, index)
+        return _localize(pd.DataFrame(data, index=index, columns=columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect an exported perf')
+    parser.add_argument('path')
+    parser.add_argument('--table', default=PERF)
+    parser.add_argument('--columns', nargs='+')
+    args = parser.parse_args(argv)
+
+    export = PerfExport(args.path)
+    if not args.columns:
+        print("format: {}".format(export.format))
+        for name in export.tables():
+            print("{:<14} {:>9} rows  {}".format(name, export.meta['tables'][name]['rows'],
+                ', '.join(export.columns(name))))
+        return
+
+    start = time.time()
+    if args.table == PERF:
+        frame = export.perf(args.columns)
+    else:
+        frame = export.table(args.table, args.columns)
+    elapsed = time.time() - start
+    print(frame.describe().to_string())
+    print("\nloaded {} rows x {} columns in {:.1f} ms".format(len(frame), len(frame.columns), elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
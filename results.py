@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import cli
+import compact
+import perf_export
+
+# Content addressed store for backtest results.
+#
+# A run is keyed by a hash of the strategy source (plus any local modules it
+# imports, e.g. indicators.py), its run_algorithm config and a fingerprint of
+# the ingested exchange data. If we've seen the key before the stored perf comes
+# straight back off disk instead of rerunning the simulation.
+#
+# Each run's perf is stored with perf_export (column by column, so a column can
+# be memory mapped on its own, and transactions / orders / positions as tables
+# of their own). index.jsonl has one summary line per run which is what `query`
+# searches. ResultsStore(mode='float32') or mode='fixed' stores the price
+# columns compactly (see compact.py); load() decodes them.
+#
+#   python results.py run rsi --start 2017-6-1
+#   python results.py query "strategy == 'rsi' and max_drawdown > -0.2"
+#
+# max_drawdown follows perf.max_drawdown and is <= 0, so "drawdown under 20%"
+# is max_drawdown > -0.2.
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _catalyst_root():
+    return os.environ.get('CATALYST_ROOT', os.path.expanduser('~/.catalyst'))
+
+
+# Hash of the strategy's source plus the source of any modules in this repo it
+# imports, so editing indicators.py invalidates the rsi runs too.
+def source_fingerprint(module):
+    here = os.path.dirname(os.path.abspath(module.__file__))
+    sources = [module]
+    for value in vars(module).values():
+        if inspect.ismodule(value) and getattr(value, '__file__', None):
+            if os.path.dirname(os.path.abspath(value.__file__)) == here:
+                sources.append(value)
+
+    h = hashlib.sha256()
+    for m in sorted(set(sources), key=lambda m: m.__name__):
+        h.update(m.__name__.encode('utf-8'))
+        h.update(inspect.getsource(m).encode('utf-8'))
+    return h.hexdigest()
+
+
+# Cheap fingerprint of the ingested bundles for the given exchanges: names,
+# sizes and mtimes of the files under the catalyst data directory. Re-ingesting
+# changes it, reading doesn't.
+def data_fingerprint(exchange_names, root=None):
+    root = os.path.join(root or _catalyst_root(), 'data', 'exchanges')
+    h = hashlib.sha256()
+    for exchange in sorted(e.strip() for e in exchange_names.split(',')):
+        base = os.path.join(root, exchange)
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                h.update('{}:{}:{}\n'.format(
+                    os.path.relpath(path, root), stat.st_size, int(stat.st_mtime)).encode('utf-8'))
+    return h.hexdigest()
+
+
+# The config as it will actually run, so 1000 and 1000.0 or '2017-1-1' and
+# '2017-01-01' key the same run.
+def normalize_config(config):
+    out = {}
+    for k, v in config.items():
+        if k in ('start', 'end') and v is not None:
+            v = pd.to_datetime(v, utc=True).isoformat()
+        elif k == 'exchange_name' and v is not None:
+            v = ','.join(e.strip() for e in v.split(','))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            v = float(v)
+        out[k] = v
+    return out
+
+
+def run_key(name, config, data_root=None):
+    h = hashlib.sha256()
+    h.update(source_fingerprint(cli.load_strategy(name)).encode('utf-8'))
+    h.update(json.dumps(normalize_config(config), sort_keys=True, default=str).encode('utf-8'))
+    h.update(data_fingerprint(config['exchange_name'], data_root).encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def summarize(perf):
+    summary = dict(
+            start=str(perf.index[0]),
+            end=str(perf.index[-1]),
+            bars=len(perf),
+            ending_value=float(perf.portfolio_value.iloc[-1]),
+            total_return=float(perf.algorithm_period_return.iloc[-1]),
+            max_drawdown=float(perf.max_drawdown.min()),
+            pnl=float(perf.pnl.sum()),
+            )
+    if 'sharpe' in perf:
+        summary['sharpe'] = float(perf.sharpe.iloc[-1])
+    return summary
+
+
+class ResultsStore(object):
+    def __init__(self, root=DEFAULT_ROOT, mode=compact.FLOAT64):
+        compact.check_mode(mode)
+        self.root = root
+        self.mode = mode
+        self.index_path = os.path.join(root, 'index.jsonl')
+
+    def _run_dir(self, key):
+        return os.path.join(self.root, 'runs', key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._run_dir(key), 'run.json'))
+
+    def save(self, key, perf, name, config):
+        run_dir = self._run_dir(key)
+        perf_export.export(perf, run_dir, mode=self.mode)
+
+        entry = dict(key=key, strategy=name, created=time.time())
+        entry.update(dict((k, v) for k, v in config.items() if k not in ('start', 'end')))
+        entry.update(summarize(perf))
+
+        # run.json last, it's what marks the run as complete
+        with open(os.path.join(run_dir, 'run.json'), 'w') as f:
+            json.dump(dict(entry, config=config), f, default=str)
+        with open(self.index_path, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+    # A stored run's PerfExport, for reading single columns or the
+    # transactions / orders / positions tables.
+    def export(self, key):
+        return perf_export.PerfExport(self._run_dir(key))
+
+    # A stored perf, shaped like the one catalyst returned: transactions /
+    # orders / positions rebuilt as lists of dicts and compact columns back
+    # in float64. `columns` limits which are read.
+    def load(self, key, columns=None):
+        perf = self.export(key).perf(columns)
+        for column in perf.columns:
+            if perf[column].dtype == np.float32:
+                perf[column] = perf[column].astype(np.float64)
+        return perf
+
+    def table(self, key, name, columns=None):
+        return self.export(key).table(name, columns)
+
+    # All stored runs as a frame, one row each.
+    def runs(self):
+        if not os.path.exists(self.index_path):
+            return pd.DataFrame()
+        with open(self.index_path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        runs = pd.DataFrame(entries)
+        return runs.drop_duplicates('key', keep='last').reset_index(drop=True)
+
+    # DataFrame.query over the run index,
+    # e.g. "strategy == 'rsi' and max_drawdown > -0.2"
+    def query(self, expr):
+        runs = self.runs()
+        if runs.empty:
+            return runs
+        return runs.query(expr).reset_index(drop=True)
+
+
+# cli.run, but memoized in the store.
+def cached_run(name, store=None, data_root=None, **overrides):
+    store = store or ResultsStore()
+    config = cli.strategy_config(name, **overrides)
+    key = run_key(name, config, data_root)
+
+    if key in store:
+        return store.load(key)
+
+    perf = cli.run(name, plot=False, **config)
+    store.save(key, perf, name, config)
+    # what a hit would return, so a run looks the same cached or not
+    return store.load(key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memoized backtest runs')
+    parser.add_argument('--root', default=DEFAULT_ROOT)
+    parser.add_argument('--mode', choices=compact.MODES, default=compact.FLOAT64,
+            help='how new runs store their price columns, see compact.py')
+    sub = parser.add_subparsers(dest='command')
+
+    run = sub.add_parser('run', help='run a strategy, or load it if this exact run is stored')
+    run.add_argument('strategy', choices=sorted(cli.STRATEGIES))
+    run.add_argument('--start')
+    run.add_argument('--end')
+    run.add_argument('--exchange', dest='exchange_name')
+    run.add_argument('--capital', dest='capital_base', type=float)
+    run.add_argument('--frequency', dest='data_frequency', choices=['daily', 'minute'])
+
+    query = sub.add_parser('query', help='search stored runs')
+    query.add_argument('expr', nargs='?')
+
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.root, args.mode)
+
+    if args.command == 'run':
+        perf = cached_run(args.strategy, store,
+                start=args.start,
+                end=args.end,
+                exchange_name=args.exchange_name,
+                capital_base=args.capital_base,
+                data_frequency=args.data_frequency,
+                )
+        cli.print_summary(perf)
+    elif args.command == 'query':
+        runs = store.query(args.expr) if args.expr else store.runs()
+        columns = ['key', 'strategy', 'start', 'end', 'data_frequency', 'exchange_name',
+                'capital_base', 'total_return', 'max_drawdown']
+        print(runs[[c for c in columns if c in runs]].to_string(index=False))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+import cli
+import shard
+
+# Streaming risk monitor.
+#
+# Tracks peak equity, drawdown, exposure and rolling volatility as the backtest
+# runs, in O(1) per bar, and stops the run as soon as one of the limits is
+# breached instead of simulating the rest of the year. The stopped run comes
+# back as a truncated perf built from what the monitor saw, with catalyst's
+# core columns (starting / ending cash and value, pnl, returns, sharpe,
+# transactions...) so the strategy's analyze and cli.print_summary work on it,
+# plus terminated=True and the reason on every row.
+#
+#   perf = risk.run_with_limits('momentum', max_drawdown=0.3, min_equity=500)
+#   python risk.py macd --max-drawdown 0.3
+
+
+class RiskLimitBreached(Exception):
+    def __init__(self, reason, dt):
+        super(RiskLimitBreached, self).__init__('{} at {}'.format(reason, dt))
+        self.reason = reason
+        self.dt = dt
+
+
+class RiskMonitor(object):
+    # max_drawdown is a positive fraction (0.3 = stop at a 30% drawdown),
+    # max_exposure a fraction of portfolio value, max_volatility the std of
+    # per-bar returns over the last vol_window bars. None disables a limit.
+    def __init__(self, max_drawdown=None, min_equity=None, max_exposure=None,
+            max_volatility=None, vol_window=30, capital_base=None):
+        self.capital_base = capital_base
+        self.max_drawdown = max_drawdown
+        self.min_equity = min_equity
+        self.max_exposure = max_exposure
+        self.max_volatility = max_volatility
+        self.vol_window = vol_window
+
+        self.peak = None
+        self.last_value = None
+        self.drawdown = 0.0
+        self.worst_drawdown = 0.0
+        self.exposure = 0.0
+        self.volatility = np.nan
+
+        # ring buffer of the last vol_window returns plus running sums
+        self._returns = np.zeros(vol_window)
+        self._count = 0
+        self._sum = 0.0
+        self._sumsq = 0.0
+
+        # asset -> (amount, last price) as of the previous bar
+        self._positions = {}
+        # the strategy's context, set by guard, for analyze after a breach
+        self.context = None
+
+        self.rows = []
+
+    def _push_return(self, r):
+        slot = self._count % self.vol_window
+        if self._count >= self.vol_window:
+            old = self._returns[slot]
+            self._sum -= old
+            self._sumsq -= old * old
+        self._returns[slot] = r
+        self._sum += r
+        self._sumsq += r * r
+        self._count += 1
+
+        n = min(self._count, self.vol_window)
+        if n > 1:
+            var = (self._sumsq - self._sum * self._sum / n) / (n - 1)
+            self.volatility = math.sqrt(max(var, 0.0))
+
+    # What was traded since the previous bar, one catalyst style transaction
+    # per asset whose position changed (net of everything filled in between).
+    def _transactions(self, dt, positions):
+        transactions = []
+        for asset in list(positions) + [a for a in self._positions if a not in positions]:
+            before = self._positions.get(asset, (0, None))
+            amount, price = positions.get(asset, (0, before[1]))
+            traded = amount - before[0]
+            if traded:
+                transactions.append(dict(amount=traded, price=price, dt=dt, sid=asset, commission=None))
+        self._positions = dict((a, p) for a, p in positions.items() if p[0])
+        return transactions
+
+    # Feed one bar. positions is asset -> (amount, last price), used to fill in
+    # the transactions column. Returns the reason for the first breached limit,
+    # or None.
+    def update(self, dt, portfolio_value, cash, extra=None, positions=None):
+        if self.last_value is not None and self.last_value != 0:
+            self._push_return(portfolio_value / self.last_value - 1)
+        self.last_value = portfolio_value
+
+        if self.peak is None or portfolio_value > self.peak:
+            self.peak = portfolio_value
+        self.drawdown = portfolio_value / self.peak - 1 if self.peak else 0.0
+        self.worst_drawdown = min(self.worst_drawdown, self.drawdown)
+        self.exposure = (portfolio_value - cash) / portfolio_value if portfolio_value else 0.0
+
+        row = dict(extra or {})
+        row.update(
+                period_close=dt,
+                portfolio_value=portfolio_value,
+                cash=cash,
+                drawdown=self.drawdown,
+                max_drawdown=self.worst_drawdown,
+                exposure=self.exposure,
+                volatility=self.volatility,
+                transactions=self._transactions(dt, positions or {}),
+                )
+        self.rows.append(row)
+        return self.check()
+
+    def check(self):
+        if self.max_drawdown is not None and -self.drawdown >= self.max_drawdown:
+            return 'drawdown {:.1%} >= {:.1%}'.format(-self.drawdown, self.max_drawdown)
+        if self.min_equity is not None and self.last_value < self.min_equity:
+            return 'equity {:.2f} < {:.2f}'.format(self.last_value, self.min_equity)
+        if self.max_exposure is not None and abs(self.exposure) > self.max_exposure:
+            return 'exposure {:.1%} > {:.1%}'.format(self.exposure, self.max_exposure)
+        if self.max_volatility is not None and self.volatility > self.max_volatility:
+            return 'volatility {:.4f} > {:.4f}'.format(self.volatility, self.max_volatility)
+        return None
+
+    # What the monitor saw so far, shaped like a perf frame.
+    def perf(self, reason=None, bars_per_year=shard.BARS_PER_YEAR['daily']):
+        perf = pd.DataFrame(self.rows).set_index('period_close')
+        perf.index.name = None
+        values = perf['portfolio_value'].values
+        cash = perf['cash'].values
+        start = self.capital_base or values[0]
+        previous = np.r_[start, values[:-1]]
+
+        perf['starting_cash'] = np.r_[start if self.capital_base else cash[0], cash[:-1]]
+        perf['ending_cash'] = cash
+        perf['starting_value'] = previous - perf['starting_cash'].values
+        perf['ending_value'] = values - cash
+        perf['pnl'] = values - previous
+        perf['returns'] = values / previous - 1
+        perf['algorithm_period_return'] = values / start - 1
+        for column in ['algo_volatility', 'sharpe', 'sortino']:
+            perf[column] = np.nan
+        shard._risk_columns(perf, perf['returns'].values, bars_per_year=bars_per_year)
+        perf['terminated'] = reason is not None
+        perf['termination_reason'] = reason
+        return perf
+
+
+# Wrap a handle_data so the monitor sees every bar after the strategy has run.
+def guard(handle_data, monitor):
+    def guarded(context, data):
+        handle_data(context, data)
+        monitor.context = context
+        portfolio = context.portfolio
+        recorded = dict(getattr(context, 'recorded_vars', {}) or {})
+        positions = dict((asset, (p.amount, p.last_sale_price)) for asset, p in portfolio.positions.items())
+        reason = monitor.update(data.current_dt, portfolio.portfolio_value, portfolio.cash, recorded,
+                positions)
+        if reason is not None:
+            raise RiskLimitBreached(reason, data.current_dt)
+    return guarded
+
+
+# cli.run with risk limits. A run that breaches a limit stops there and returns
+# the truncated perf (handed to the strategy's analyze first when plot is set),
+# otherwise the normal perf comes back with terminated=False.
+def run_with_limits(name, max_drawdown=None, min_equity=None, max_exposure=None,
+        max_volatility=None, vol_window=30, plot=False, **overrides):
+    config = cli.strategy_config(name, **overrides)
+    monitor = RiskMonitor(max_drawdown, min_equity, max_exposure, max_volatility, vol_window,
+            capital_base=config['capital_base'])
+    strategy = cli.load_strategy(name)
+
+    try:
+        perf = cli.run(name, plot=plot,
+                handle_data=guard(strategy.handle_data, monitor),
+                **overrides)
+    except RiskLimitBreached as e:
+        perf = monitor.perf(e.reason, shard.BARS_PER_YEAR[config['data_frequency']])
+        if plot:
+            strategy.analyze(monitor.context, perf)
+        return perf
+
+    perf['terminated'] = False
+    perf['termination_reason'] = None
+    return perf
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a strategy with risk limits')
+    parser.add_argument('strategy', choices=sorted(cli.STRATEGIES))
+    parser.add_argument('--max-drawdown', type=float, help='e.g. 0.3 for 30%%')
+    parser.add_argument('--min-equity', type=float)
+    parser.add_argument('--max-exposure', type=float)
+    parser.add_argument('--max-volatility', type=float)
+    parser.add_argument('--vol-window', type=int, default=30)
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--capital', dest='capital_base', type=float)
+    parser.add_argument('--frequency', dest='data_frequency', choices=['daily', 'minute'])
+    args = parser.parse_args(argv)
+
+    perf = run_with_limits(args.strategy,
+            max_drawdown=args.max_drawdown,
+            min_equity=args.min_equity,
+            max_exposure=args.max_exposure,
+            max_volatility=args.max_volatility,
+            vol_window=args.vol_window,
+            start=args.start,
+            end=args.end,
+            capital_base=args.capital_base,
+            data_frequency=args.data_frequency,
+            )
+
+    if perf['terminated'].iloc[-1]:
+        print("Terminated at {}: {}".format(perf.index[-1], perf['termination_reason'].iloc[-1]))
+    cli.print_summary(perf)
+
+
+if __name__ == '__main__':
+    main()
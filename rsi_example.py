@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from logbook import Logger
 from math import floor, ceil
 
@@ -8,6 +7,8 @@ from catalyst import run_algorithm
 from catalyst.api import order_target_percent, record, symbol
 from catalyst.exchange.utils.stats_utils import extract_transactions
 
+import indicators
+
 # Before you run, make sure you ingest the data..
 # catalyst ingest-exchange -x bitfinex -i btc_usd -f minute
 
@@ -44,13 +45,8 @@ def handle_data(context, data):
     oversold = 30
     overbought = 70
 
-    deltas  = RSI_data.diff()
-    seed    = deltas[:RSI_periods + 1]
-    up      = seed[seed >= 0].sum() / RSI_periods
-    down    = -seed[seed < 0].sum() / RSI_periods
-
-    RS = up / down
-    RSI = 100 - (100 / (1 + RS))
+    # Sum of the up moves vs sum of the down moves over the window, see indicators.py
+    RSI = indicators.rsi(RSI_data.values, RSI_periods)[-1]
     # End compute RSI
 
     # get current price
@@ -104,6 +100,8 @@ def handle_data(context, data):
 
 
 def analyze(context, perf):
+    import matplotlib.pyplot as plt
+
     # get the quote_currency that was passed as a parameter to the simulation
 
 
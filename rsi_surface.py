@@ -0,0 +1,148 @@
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import compact
+import indicators
+
+# RSI sensitivity surface.
+#
+# rsi_example trades one period (14) with fixed 30/70 thresholds. This runs the
+# same rules over a whole grid of periods x oversold x overbought levels in one
+# pass over the bars: indicators.rsi_batch gives a (time x period) RSI array and
+# the position state for every grid cell is stepped forward together with numpy.
+#
+#   python rsi_surface.py prices.csv
+#
+# where prices.csv has a datetime index and a `price` column (e.g. the recorded
+# perf from a previous rsi_example run).
+
+Surface = namedtuple('Surface', [
+    'periods',
+    'oversold',
+    'overbought',
+    'pnl',            # (period x oversold x overbought), in quote currency
+    'max_drawdown',   # same shape, <= 0 like perf.max_drawdown
+    'trades',         # same shape, number of position changes
+])
+
+
+# Same entry / exit rules as rsi_example.handle_data:
+#   flat  and RSI <= oversold   -> long
+#   short and RSI <= exit_short -> flat
+#   flat  and RSI >= overbought -> short
+#   long  and RSI >= exit_long  -> flat
+# Orders placed on a bar fill on the next one, like the daily backtest.
+def evaluate_grid(prices,
+        periods=range(2, 51),
+        oversold=range(10, 50, 5),
+        overbought=range(55, 95, 5),
+        exit_long=60,
+        exit_short=40,
+        capital_base=1000,
+        mode=compact.FLOAT64):
+    prices = np.asarray(prices, dtype=float)
+    periods = np.asarray(list(periods), dtype=np.int64)
+    oversold = np.asarray(list(oversold), dtype=float)
+    overbought = np.asarray(list(overbought), dtype=float)
+
+    rsi = indicators.rsi_batch(prices, periods, dtype=compact.compute_dtype(mode))
+    returns = np.r_[0.0, prices[1:] / prices[:-1] - 1]
+
+    shape = (len(periods), len(oversold), len(overbought))
+    os_level = oversold[None, :, None]
+    ob_level = overbought[None, None, :]
+
+    target = np.zeros(shape)    # position wanted after this bar
+    held = np.zeros(shape)      # position actually held (last bar's target)
+    equity = np.ones(shape)
+    peak = np.ones(shape)
+    max_drawdown = np.zeros(shape)
+    trades = np.zeros(shape, dtype=np.int64)
+
+    for t in range(len(prices)):
+        # Mark to market with what we held coming into this bar
+        equity *= 1 + held * returns[t]
+        np.maximum(peak, equity, out=peak)
+        np.minimum(max_drawdown, equity / peak - 1, out=max_drawdown)
+
+        # Yesterday's orders fill now
+        trades += held != target
+        held = target.copy()
+
+        r = rsi[t][:, None, None]
+        # NaN compares False everywhere, so warm up bars never trade
+        go_long = (held == 0) & (r <= os_level)
+        cover = (held < 0) & (r <= exit_short)
+        go_short = (held == 0) & (r >= ob_level) & ~go_long
+        sell = (held > 0) & (r >= exit_long)
+
+        target = np.where(go_long, 1.0, target)
+        target = np.where(cover | sell, 0.0, target)
+        target = np.where(go_short, -1.0, target)
+
+    return Surface(periods, oversold, overbought,
+            (equity - 1) * capital_base, max_drawdown, trades)
+
+
+# One (oversold x overbought) slice of the surface for a given period.
+def surface_frame(surface, field='pnl', period=14):
+    j = int(np.flatnonzero(surface.periods == period)[0])
+    return pd.DataFrame(getattr(surface, field)[j],
+            index=pd.Index(surface.oversold, name='oversold'),
+            columns=pd.Index(surface.overbought, name='overbought'))
+
+
+# (period x oversold) slice with overbought mirrored as 100 - oversold, the
+# "how fragile is 14 / 30 / 70" view.
+def symmetric_frame(surface, field='pnl'):
+    values = getattr(surface, field)
+    rows = []
+    cols = []
+    for i, level in enumerate(surface.oversold):
+        k = np.flatnonzero(surface.overbought == 100 - level)
+        if len(k):
+            cols.append(level)
+            rows.append(values[:, i, k[0]])
+    return pd.DataFrame(np.array(rows).T,
+            index=pd.Index(surface.periods, name='period'),
+            columns=pd.Index(cols, name='oversold'))
+
+
+def plot_heatmaps(surface, filename='rsi_surface.png'):
+    import matplotlib.pyplot as plt
+
+    frames = [
+            ('P&L', symmetric_frame(surface, 'pnl'), 'RdYlGn'),
+            ('Max drawdown', symmetric_frame(surface, 'max_drawdown'), 'Reds_r'),
+            ]
+
+    for n, (title, frame, cmap) in enumerate(frames):
+        ax = plt.subplot(1, len(frames), n + 1)
+        im = ax.imshow(frame.values, aspect='auto', origin='lower', cmap=cmap)
+        ax.set_title('{} (overbought = 100 - oversold)'.format(title))
+        ax.set_xlabel('Oversold')
+        ax.set_ylabel('RSI period')
+        ax.set_xticks(np.arange(len(frame.columns)))
+        ax.set_xticklabels(frame.columns)
+        ticks = np.arange(0, len(frame.index), max(1, len(frame.index) // 10))
+        ax.set_yticks(ticks)
+        ax.set_yticklabels(frame.index[ticks])
+        plt.colorbar(im, ax=ax)
+
+    plt.savefig(filename)
+    plt.show()
+
+
+if __name__ == '__main__':
+    prices = pd.read_csv(sys.argv[1], index_col=0, parse_dates=True)['price']
+    surface = evaluate_grid(prices.dropna().values)
+
+    print("P&L for period 14:")
+    print(surface_frame(surface, 'pnl', 14))
+    print("Max drawdown for period 14:")
+    print(surface_frame(surface, 'max_drawdown', 14))
+
+    plot_heatmaps(surface)
@@ -0,0 +1,315 @@
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import cli
+
+# Time sharded backtests.
+#
+# Splits the start/end of a run into N windows and runs each one in its own
+# process. Every shard after the first starts `warmup` days early so the
+# strategy's indicators (and its own "have I bought yet" flags) are primed by the
+# time its window begins. The per-shard perf frames are then chained back into
+# one: each shard contributes its returns, compounded onto where the previous
+# shard finished, so portfolio state carries over across the boundaries, and
+# catalyst's running columns (sharpe, sortino, volatility, alpha / beta,
+# benchmark return, drawdown) are recomputed over the stitched returns.
+#
+#   python shard.py rsi --shards 4
+#   python shard.py macd --shards 8 --start 2015-1-1 --end 2018-1-1 --frequency minute
+#
+# The stitched run only matches a serial one if each shard's warm-up ends up
+# holding the same position the previous shard held at the boundary. That's
+# checked on the overlapping bars and reported in `divergence`.
+
+# Days of history each strategy needs before its signals mean anything
+# (their data.history calls are all on 1d bars).
+WARMUP_DAYS = {
+    'rsi': 14,
+    'macd': 40,
+    'momentum': 20,
+    'hodl': 0,
+    'graphing': 0,
+    'arbitrage': 0,
+}
+
+# perf columns that are amounts of money, rescaled when a shard is chained onto
+# the previous one. Recorded columns (price, RSI...) are left alone.
+MONEY_COLUMNS = [
+    'portfolio_value',
+    'starting_value',
+    'ending_value',
+    'starting_cash',
+    'ending_cash',
+    'cash',
+    'starting_exposure',
+    'ending_exposure',
+    'long_value',
+    'short_value',
+    'long_exposure',
+    'short_exposure',
+    'capital_used',
+]
+
+# Bars per year for annualizing the stitched risk columns, crypto trades every
+# day around the clock
+BARS_PER_YEAR = {
+    'daily': 365,
+    'minute': 365 * 24 * 60,
+}
+
+RISK_COLUMNS = ['algo_volatility', 'sharpe', 'sortino', 'benchmark_period_return',
+        'benchmark_volatility', 'alpha', 'beta']
+
+Shard = namedtuple('Shard', ['run_start', 'start', 'end'])
+ShardedResult = namedtuple('ShardedResult', ['perf', 'divergence', 'shards'])
+
+
+# N contiguous windows covering [start, end], each with its warm-up start.
+def split_range(start, end, n, warmup_days=0):
+    start = pd.to_datetime(start, utc=True).normalize()
+    end = pd.to_datetime(end, utc=True).normalize()
+    days = (end - start).days
+    n = max(1, min(n, days))
+    edges = [start + pd.Timedelta(days=int(round(days * k / float(n)))) for k in range(n + 1)]
+
+    shards = []
+    for k in range(n):
+        shard_start = edges[k]
+        shard_end = edges[k + 1] if k == n - 1 else edges[k + 1] - pd.Timedelta(days=1)
+        run_start = shard_start if k == 0 else shard_start - pd.Timedelta(days=warmup_days)
+        shards.append(Shard(run_start, shard_start, shard_end))
+    return shards
+
+
+def run_shard(name, shard, overrides):
+    return cli.run(name, plot=False, start=shard.run_start, end=shard.end, **overrides)
+
+
+# Fraction of the portfolio in positions on each bar.
+def _exposure(perf):
+    return (perf['portfolio_value'] - perf['cash']) / perf['portfolio_value']
+
+
+# Each bar's benchmark return, from a perf's cumulative benchmark_period_return
+# (the bar before `start` is the base, or nothing for a shard without warm-up).
+def _benchmark_returns(perf, start):
+    cumulative = perf['benchmark_period_return'].astype(float)
+    warm = cumulative[perf.index < start]
+    kept = cumulative[perf.index >= start].values
+    previous = warm.iloc[-1] if len(warm) else 0.0
+    return (1 + kept) / (1 + np.r_[previous, kept[:-1]]) - 1
+
+
+# Catalyst's cumulative risk columns, recomputed over the whole stitched run
+# from the stitched returns (each shard's own restart at its boundary).
+def _risk_columns(stitched, returns, benchmark_returns=None, bars_per_year=BARS_PER_YEAR['daily']):
+    n = np.arange(1, len(returns) + 1, dtype=float)
+    annual = np.sqrt(bars_per_year)
+
+    def expanding_std(r, mean):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (np.cumsum(r * r) - n * mean * mean) / (n - 1)
+        return np.sqrt(np.maximum(var, 0))
+
+    mean = np.cumsum(returns) / n
+    std = expanding_std(returns, mean)
+    downside = np.sqrt(np.cumsum(np.minimum(returns, 0) ** 2) / n)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columns = {
+            'algo_volatility': std * annual,
+            'sharpe': mean / std * annual,
+            'sortino': mean / downside * annual,
+        }
+        if benchmark_returns is not None:
+            b_mean = np.cumsum(benchmark_returns) / n
+            b_std = expanding_std(benchmark_returns, b_mean)
+            cov = (np.cumsum(returns * benchmark_returns) - n * mean * b_mean) / (n - 1)
+            beta = cov / (b_std * b_std)
+            columns.update(
+                    benchmark_period_return=np.cumprod(1 + benchmark_returns) - 1,
+                    benchmark_volatility=b_std * annual,
+                    beta=beta,
+                    alpha=(1 + mean - beta * b_mean) ** bars_per_year - 1,
+                    )
+
+    for column, values in columns.items():
+        if column in stitched:
+            stitched[column] = np.where(np.isfinite(values), values, np.nan)
+
+
+# _risk_columns for a run mixing minute and daily bars: the returns are
+# compounded to days first, and each day's figures land on its last bar and
+# carry forward over the next day's.
+def _daily_risk_columns(stitched, returns, benchmark_returns=None):
+    day = stitched.index.normalize()
+    daily = pd.DataFrame(index=day.unique(), columns=[c for c in RISK_COLUMNS if c in stitched])
+    daily_returns = pd.Series(1 + returns).groupby(day).prod().values - 1
+    daily_benchmark = None
+    if benchmark_returns is not None:
+        daily_benchmark = pd.Series(1 + benchmark_returns).groupby(day).prod().values - 1
+    _risk_columns(daily, daily_returns, daily_benchmark, BARS_PER_YEAR['daily'])
+
+    last_of_day = np.r_[day[1:] != day[:-1], True]
+    for column in daily.columns:
+        values = np.full(len(stitched), np.nan)
+        values[last_of_day] = daily[column].values
+        stitched[column] = pd.Series(values).ffill().values
+
+
+# Chain the shard perfs into one frame. Each shard is trimmed to its own window
+# and its per-bar returns are compounded onto the previous shard's last value.
+# data_frequency is the run's bar size, or one per shard when they differ
+# (adaptive.py).
+def stitch(perfs, shards, capital_base, data_frequency='daily'):
+    if isinstance(data_frequency, str):
+        data_frequency = [data_frequency] * len(shards)
+    pieces = []
+    benchmark = []
+    frequencies = set()
+    value = float(capital_base)
+
+    for perf, shard, frequency in zip(perfs, shards, data_frequency):
+        kept = perf[perf.index >= shard.start].copy()
+        if kept.empty:
+            continue
+        frequencies.add(frequency)
+
+        # Returns relative to the bar before the window (the end of the warm-up),
+        # or the starting capital for the first shard
+        warm = perf[perf.index < shard.start]
+        previous = warm['portfolio_value'].iloc[-1] if len(warm) else perf['starting_cash'].iloc[0]
+        shard_values = kept['portfolio_value'].values
+        returns = shard_values / np.r_[previous, shard_values[:-1]] - 1
+
+        stitched_values = value * np.cumprod(1 + returns)
+        scale = stitched_values / shard_values
+        for column in MONEY_COLUMNS:
+            if column in kept:
+                kept[column] = kept[column].values * scale
+
+        kept['portfolio_value'] = stitched_values
+        kept['returns'] = returns
+        if 'benchmark_period_return' in kept:
+            benchmark.append(_benchmark_returns(perf, shard.start))
+        value = stitched_values[-1]
+        pieces.append(kept)
+
+    stitched = pd.concat(pieces)
+    values = stitched['portfolio_value']
+    stitched['pnl'] = values.diff().fillna(values.iloc[0] - capital_base)
+    stitched['algorithm_period_return'] = values / capital_base - 1
+    stitched['max_drawdown'] = (values / np.maximum.accumulate(values.values) - 1).cummin()
+
+    # the rest of catalyst's running totals, which restart in every shard
+    returns = stitched['returns'].values.astype(float)
+    benchmark = np.concatenate(benchmark) if len(benchmark) == len(pieces) else None
+    if len(frequencies) == 1:
+        _risk_columns(stitched, returns, benchmark, BARS_PER_YEAR[frequencies.pop()])
+    else:
+        _daily_risk_columns(stitched, returns, benchmark)
+    if 'trading_days' in stitched:
+        day = stitched.index.normalize()
+        stitched['trading_days'] = np.cumsum(np.r_[True, day[1:] != day[:-1]])
+    if 'max_leverage' in stitched and 'gross_leverage' in stitched:
+        stitched['max_leverage'] = stitched['gross_leverage'].cummax()
+    if 'excess_return' in stitched and 'treasury_period_return' in stitched:
+        stitched['excess_return'] = stitched['algorithm_period_return'] - stitched['treasury_period_return']
+    return stitched
+
+
+# How well each shard's warm-up reproduces the previous shard on the bars they
+# both cover. A boundary is clean if the two exposures agree by the time the new
+# shard's window starts; `converged_at` is the first bar from which they agree.
+def divergence(perfs, shards, tolerance=1e-6):
+    rows = []
+    for k in range(1, len(shards)):
+        before, after, shard = perfs[k - 1], perfs[k], shards[k]
+        overlap = after.index[(after.index < shard.start) & after.index.isin(before.index)]
+
+        row = dict(boundary=shard.start, overlap_bars=len(overlap),
+                converged_at=pd.NaT, exposure_serial=np.nan, exposure_shard=np.nan,
+                max_abs_diff=np.nan, diverged=True)
+
+        if len(overlap):
+            diff = (_exposure(before.loc[overlap]) - _exposure(after.loc[overlap])).abs().fillna(np.inf)
+            agree = (diff <= tolerance).values
+            # first bar after which they agree all the way to the boundary
+            tail = np.flatnonzero(~agree)
+            first = 0 if len(tail) == 0 else tail[-1] + 1
+            row.update(
+                    exposure_serial=_exposure(before.loc[overlap[-1:]]).iloc[0],
+                    exposure_shard=_exposure(after.loc[overlap[-1:]]).iloc[0],
+                    max_abs_diff=diff.replace(np.inf, np.nan).max(),
+                    diverged=bool(not agree[-1]),
+                    )
+            if first < len(overlap):
+                row['converged_at'] = overlap[first]
+
+        rows.append(row)
+
+    columns = ['boundary', 'overlap_bars', 'converged_at', 'exposure_serial',
+            'exposure_shard', 'max_abs_diff', 'diverged']
+    return pd.DataFrame(rows, columns=columns)
+
+
+# Run a strategy from cli.STRATEGIES as `n` time shards on separate processes.
+def run_sharded(name, n, warmup_days=None, max_workers=None, **overrides):
+    config = cli.strategy_config(name, **overrides)
+    if warmup_days is None:
+        warmup_days = WARMUP_DAYS.get(name, 0)
+
+    shards = split_range(config['start'], config['end'], n, warmup_days)
+    overrides = dict((k, v) for k, v in config.items() if k not in ('start', 'end'))
+
+    with ProcessPoolExecutor(max_workers=max_workers or len(shards)) as pool:
+        futures = [pool.submit(run_shard, name, shard, overrides) for shard in shards]
+        perfs = [f.result() for f in futures]
+
+    for perf in perfs:
+        perf.index = pd.to_datetime(perf.index, utc=True)
+
+    return ShardedResult(
+            stitch(perfs, shards, config['capital_base'], config['data_frequency']),
+            divergence(perfs, shards),
+            shards)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a strategy as parallel time shards')
+    parser.add_argument('strategy', choices=sorted(cli.STRATEGIES))
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--warmup', type=int, help='warm-up days, defaults to the strategy lookback')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--exchange', dest='exchange_name')
+    parser.add_argument('--capital', dest='capital_base', type=float)
+    parser.add_argument('--frequency', dest='data_frequency', choices=['daily', 'minute'])
+    args = parser.parse_args(argv)
+
+    result = run_sharded(args.strategy, args.shards,
+            warmup_days=args.warmup,
+            max_workers=args.workers,
+            start=args.start,
+            end=args.end,
+            exchange_name=args.exchange_name,
+            capital_base=args.capital_base,
+            data_frequency=args.data_frequency,
+            )
+
+    cli.print_summary(result.perf)
+    print("")
+    print("Shard boundaries:")
+    print(result.divergence.to_string(index=False))
+    if result.divergence['diverged'].any():
+        print("WARNING: some shards did not converge to the serial position by their boundary, "
+              "try a longer --warmup")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# Sparse, event driven backtesting for threshold and crossover rules.
+#
+# Strategies like graphing_example only ever act on a handful of bars (the first
+# time price goes above 5900, the first time it goes above 6200...) but
+# run_algorithm still wakes handle_data up on every minute. Here we find the bars
+# where a condition can first become true up front, using vectorized ops over the
+# whole price series, call the user logic only on those bars and forward-fill the
+# portfolio state and recorded columns in between.
+#
+# Usage:
+#   events = sparse.merge_events(
+#       sparse.first_crossing(prices, 5900),
+#       sparse.first_crossing(prices, 6200),
+#   )
+#   perf = sparse.run_sparse(prices, events, handle_event, capital_base=10000)
+
+
+# Index of the first bar where price > level (or < level with above=False).
+# A running max is sorted, so we can searchsorted into it instead of scanning.
+# Returns None if the level is never crossed. Missing (NaN) bars never count.
+def first_crossing(prices, level, above=True):
+    values = np.asarray(prices, dtype=float)
+    if len(values) == 0:
+        return None
+
+    # Flip the sign for above=False so the running min becomes an ascending
+    # running max. NaN would carry forward through the max, -inf can't cross.
+    if not above:
+        values = -values
+        level = -level
+    running = np.maximum.accumulate(np.where(np.isnan(values), -np.inf, values))
+    i = np.searchsorted(running, level, side='right')
+
+    if i >= len(values):
+        return None
+    return int(i)
+
+
+# Every bar where price moves from <= level to > level (or the reverse with
+# above=False). Use this instead of first_crossing when the rule can fire again.
+def threshold_events(prices, level, above=True):
+    values = np.asarray(prices, dtype=float)
+    hit = values > level if above else values < level
+    starts = hit & ~np.r_[False, hit[:-1]]
+    return np.flatnonzero(starts)
+
+
+# Every bar where fast crosses slow, e.g. MACD vs its signal line.
+# NaNs (indicator warm up) never count as a crossing.
+def crossover_events(fast, slow):
+    diff = np.asarray(fast, dtype=float) - np.asarray(slow, dtype=float)
+    sign = np.sign(diff)
+    valid = ~np.isnan(diff)
+    changed = np.r_[False, (sign[1:] != sign[:-1]) & valid[1:] & valid[:-1]]
+    return np.flatnonzero(changed & (sign != 0))
+
+
+# Combine event indices from several detectors into one sorted array.
+# Accepts ints, arrays and None (a level that is never crossed).
+def merge_events(*events):
+    parts = []
+    for e in events:
+        if e is None:
+            continue
+        parts.append(np.atleast_1d(np.asarray(e, dtype=np.int64)))
+    if not parts:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(parts))
+
+
+class SparseBar(object):
+    def __init__(self, i, dt, price):
+        self.i = i
+        self.dt = dt
+        self.price = price
+
+
+class SparsePortfolio(object):
+    def __init__(self, capital_base):
+        self.starting_cash = capital_base
+        self.cash = capital_base
+        self.amount = 0
+
+
+# Stand in for the catalyst context inside handle_event. Orders fill immediately
+# at the event bar's price, there's no slippage or commission model here.
+class SparseContext(object):
+    def __init__(self, capital_base):
+        self.portfolio = SparsePortfolio(capital_base)
+        self.bar = None
+        self._records = {}
+
+    def order(self, amount):
+        self.portfolio.amount += amount
+        self.portfolio.cash -= amount * self.bar.price
+
+    def order_target(self, target):
+        self.order(target - self.portfolio.amount)
+
+    def record(self, **kwargs):
+        for name, value in kwargs.items():
+            self._records.setdefault(name, {})[self.bar.i] = value
+
+
+# Call handle_event(context, bar) on the event bars only, then build a perf like
+# frame for every bar. cash / amount / recorded columns are forward filled from
+# the last event, portfolio_value is marked to market on every bar.
+def run_sparse(prices, events, handle_event, capital_base=10000, initialize=None):
+    prices = pd.Series(prices).astype(float)
+    n = len(prices)
+    events = merge_events(events)
+    events = events[(events >= 0) & (events < n)]
+
+    context = SparseContext(capital_base)
+    if initialize is not None:
+        initialize(context)
+
+    values = prices.values
+    cash = np.full(len(events), np.nan)
+    amount = np.full(len(events), np.nan)
+
+    for k, i in enumerate(events):
+        context.bar = SparseBar(int(i), prices.index[i], values[i])
+        handle_event(context, context.bar)
+        cash[k] = context.portfolio.cash
+        amount[k] = context.portfolio.amount
+
+    perf = pd.DataFrame(index=prices.index)
+    perf['price'] = values
+    perf['cash'] = _fill_from_events(n, events, cash, capital_base)
+    perf['amount'] = _fill_from_events(n, events, amount, 0)
+    # missing bars are marked at the last known price, like catalyst does
+    held = perf['amount'] * prices.ffill().values
+    perf['portfolio_value'] = perf['cash'] + held.where(perf['amount'] != 0, 0.0)
+    perf['event'] = False
+    perf.iloc[events, perf.columns.get_loc('event')] = True
+
+    for name, recorded in context._records.items():
+        idx = np.fromiter(recorded.keys(), dtype=np.int64)
+        vals = np.array(list(recorded.values()), dtype=float)
+        order = np.argsort(idx)
+        perf[name] = _fill_from_events(n, idx[order], vals[order], np.nan)
+
+    return perf
+
+
+# Spread values known at event bars over all n bars, holding each one until the
+# next event. Bars before the first event get `before`.
+def _fill_from_events(n, events, values, before):
+    out = np.full(n, before, dtype=float)
+    if len(events) == 0:
+        return out
+    # position of the most recent event at or before each bar
+    last = np.searchsorted(events, np.arange(n), side='right') - 1
+    has_event = last >= 0
+    out[has_event] = np.asarray(values, dtype=float)[last[has_event]]
+    return out
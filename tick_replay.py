@@ -0,0 +1,225 @@
+import heapq
+import os
+
+import numpy as np
+
+# Tick and order book replay for arbitrage.
+#
+# arbitrage.py only sees one minute bar price per venue. This replays recorded
+# trades and top of book snapshots instead. Each recording is a flat file of
+# fixed width records (the numpy dtypes below, no header) which is memory mapped,
+# so a file of any size costs only the pages we're currently reading.
+#
+# Streams from several venues are merged into timestamp order:
+#   - Replay.events() yields one event at a time off a heap of stream heads
+#   - Replay.batches() merges a chunk of every stream at once and yields the
+#     merged chunk as arrays, which is what gets to millions of events a second
+#
+#   replay = Replay([
+#       Stream('data/poloniex_eth_btc_book.bin', 'poloniex', BOOK),
+#       Stream('data/binance_eth_btc_book.bin', 'binance', BOOK),
+#       Stream('data/binance_eth_btc_trades.bin', 'binance', TRADES),
+#   ])
+#   markets = {'poloniex': context.poloniex, 'binance': context.binance}
+#   for opportunity in book_arbitrage(replay, markets, slippage=0.0):
+#       ...
+#
+# book_arbitrage applies arbitrage.py's own fee and slippage functions (through
+# arb_scan.expected_profit) to the replayed quotes, a batch at a time. It does
+# not call arbitrage.handle_data per event: that needs catalyst's data and
+# order API, and one Python call per tick would undo the batching.
+
+TRADES = 'trades'
+BOOK = 'book'
+
+# How many price levels each side of a book snapshot keeps
+BOOK_LEVELS = 5
+
+# ts is nanoseconds since the epoch. side is 1 for buyer initiated, -1 for seller.
+TRADE_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('price', '<f8'),
+    ('amount', '<f8'),
+    ('side', 'i1'),
+])
+
+# Level 0 is the best bid / ask
+BOOK_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('bid_price', '<f8', (BOOK_LEVELS,)),
+    ('bid_size', '<f8', (BOOK_LEVELS,)),
+    ('ask_price', '<f8', (BOOK_LEVELS,)),
+    ('ask_size', '<f8', (BOOK_LEVELS,)),
+])
+
+DTYPES = {
+    TRADES: TRADE_DTYPE,
+    BOOK: BOOK_DTYPE,
+}
+
+# Merged batches: which stream and which record in it, in timestamp order
+EVENT_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('stream', '<i4'),
+    ('index', '<i8'),
+])
+
+
+# Append records (a structured array of the right dtype) to a recording.
+# Records have to be written in timestamp order.
+def write_records(path, records, kind):
+    records = np.asarray(records, dtype=DTYPES[kind])
+    with open(path, 'ab') as f:
+        f.write(records.tobytes())
+
+
+class Stream(object):
+    def __init__(self, path, venue, kind):
+        self.path = path
+        self.venue = venue
+        self.kind = kind
+        self.dtype = DTYPES[kind]
+
+        if os.path.getsize(path) == 0:
+            self.records = np.zeros(0, dtype=self.dtype)
+        else:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r')
+
+    def __len__(self):
+        return len(self.records)
+
+
+class Replay(object):
+    def __init__(self, streams, chunk_size=65536):
+        self.streams = list(streams)
+        self.chunk_size = chunk_size
+
+    # One (stream, record) at a time in timestamp order. Ties go to the stream
+    # listed first.
+    def events(self):
+        heap = []
+        for i, stream in enumerate(self.streams):
+            if len(stream):
+                heap.append((int(stream.records[0]['ts']), i, 0))
+        heapq.heapify(heap)
+
+        while heap:
+            ts, i, pos = heap[0]
+            stream = self.streams[i]
+            yield stream, stream.records[pos]
+
+            pos += 1
+            if pos < len(stream):
+                heapq.heapreplace(heap, (int(stream.records[pos]['ts']), i, pos))
+            else:
+                heapq.heappop(heap)
+
+    # Merged EVENT_DTYPE arrays. Every stream contributes up to chunk_size
+    # records per round, and only up to the watermark (the earliest last
+    # timestamp among the loaded chunks) so nothing later in another stream can
+    # still sort before what we emit. Memory is bounded by streams x chunk_size.
+    def batches(self):
+        cursors = [0] * len(self.streams)
+
+        while True:
+            heads = []
+            for i, stream in enumerate(self.streams):
+                if cursors[i] < len(stream):
+                    ts = stream.records['ts'][cursors[i]:cursors[i] + self.chunk_size]
+                    heads.append((i, ts))
+            if not heads:
+                return
+
+            watermark = min(ts[-1] for _, ts in heads)
+
+            parts = []
+            for i, ts in heads:
+                n = int(np.searchsorted(ts, watermark, side='right'))
+                part = np.empty(n, dtype=EVENT_DTYPE)
+                part['ts'] = ts[:n]
+                part['stream'] = i
+                part['index'] = np.arange(cursors[i], cursors[i] + n)
+                parts.append(part)
+                cursors[i] += n
+
+            batch = np.concatenate(parts)
+            # stable, so ties keep the stream order like events()
+            yield batch[np.argsort(batch['ts'], kind='mergesort')]
+
+    def venues(self):
+        return sorted(set(s.venue for s in self.streams))
+
+
+# Best bid / ask for each venue on every event of a merged batch, carrying the
+# last known quote in from previous batches via `last` (venue -> (bid, ask)).
+def _top_of_book(replay, batch, last):
+    n = len(batch)
+    quotes = {}
+    for venue in replay.venues():
+        bid = np.full(n, np.nan)
+        ask = np.full(n, np.nan)
+        for i, stream in enumerate(replay.streams):
+            if stream.venue != venue or stream.kind != BOOK:
+                continue
+            mask = batch['stream'] == i
+            records = stream.records[batch['index'][mask]]
+            bid[mask] = records['bid_price'][:, 0]
+            ask[mask] = records['ask_price'][:, 0]
+
+        # forward fill from the latest snapshot, or the previous batch's last one
+        have = ~np.isnan(bid)
+        latest = np.maximum.accumulate(np.where(have, np.arange(n), -1))
+        prev_bid, prev_ask = last.get(venue, (np.nan, np.nan))
+        bid = np.where(latest >= 0, bid[np.maximum(latest, 0)], prev_bid)
+        ask = np.where(latest >= 0, ask[np.maximum(latest, 0)], prev_ask)
+        if n:
+            last[venue] = (bid[-1], ask[-1])
+        quotes[venue] = (bid, ask)
+    return quotes
+
+
+# Every event at which selling at one venue's best bid and buying at another's
+# best ask is profitable by arbitrage.is_profitable_after_fees, i.e. after
+# get_adjusted_prices(slippage) and get_fee. markets is venue -> catalyst
+# exchange, or arb_scan.Market for a plain taker fee. Yields one structured
+# array of opportunities per batch that has any.
+def book_arbitrage(replay, markets, slippage=0.0):
+    # not at the top, feed.py uses this module without catalyst around
+    from arb_scan import expected_profit
+
+    last = {}
+    venues = replay.venues()
+    dtype = np.dtype([
+        ('ts', '<i8'),
+        ('sell_venue', 'U16'),
+        ('buy_venue', 'U16'),
+        ('sell_price', '<f8'),
+        ('buy_price', '<f8'),
+        ('expected_profit', '<f8'),
+    ])
+
+    for batch in replay.batches():
+        quotes = _top_of_book(replay, batch, last)
+        found = []
+        for sell in venues:
+            for buy in venues:
+                if sell == buy:
+                    continue
+                bid = quotes[sell][0]
+                ask = quotes[buy][1]
+                profit = expected_profit(bid, ask, slippage, markets[sell], markets[buy])
+                hit = np.flatnonzero(profit > 0)
+                if len(hit) == 0:
+                    continue
+                out = np.empty(len(hit), dtype=dtype)
+                out['ts'] = batch['ts'][hit]
+                out['sell_venue'] = sell
+                out['buy_venue'] = buy
+                out['sell_price'] = bid[hit]
+                out['buy_price'] = ask[hit]
+                out['expected_profit'] = profit[hit]
+                found.append(out)
+
+        if found:
+            found = np.concatenate(found)
+            yield found[np.argsort(found['ts'], kind='mergesort')]